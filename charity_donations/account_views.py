@@ -0,0 +1,77 @@
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.contrib.auth.views import PasswordResetConfirmView
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.mail import send_mail
+from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.views import View
+
+from charity_donations.forms import CustomSetPasswordForm, RegistrationForm
+from config import settings
+
+# Registration, activation and password reset, loaded on first use (see urls.lazy_view)
+
+
+class RegisterView(View):
+    def get(self, request):
+        form = RegistrationForm()
+        return render(request, 'register.html', {'form': form})
+
+    def post(self, request):
+        form = RegistrationForm(request.POST)
+        if form.is_valid():
+            first_name = form.cleaned_data.get('first_name')
+            last_name = form.cleaned_data.get('last_name')
+            username = form.cleaned_data.get('username')
+            email = form.cleaned_data.get('email')
+            password = form.cleaned_data.get('password')
+
+            # Save the user with inactive status
+            u = User(username=username, email=email, first_name=first_name, last_name=last_name, is_active=False)
+            u.set_password(password)
+            u.save()
+
+            # Email account activation part
+            current_site = get_current_site(request)
+            mail_subject = 'Activate your account.'
+            uid = urlsafe_base64_encode(force_bytes(u.pk))
+            token = default_token_generator.make_token(u)
+            message = render_to_string('activation_email.html', {
+                'user': u,
+                'domain': current_site.domain,
+                'uid': uid,
+                'token': token,
+            })
+            send_mail(mail_subject, message, settings.DEFAULT_FROM_EMAIL, [email])
+
+            messages.success(request,
+                             'Prosimy o potwierdzenie konta poprzez link wysłany na podane w rejestracji adres email.')
+            return redirect('Login')
+
+        return render(request, 'register.html', {'form': form})
+
+
+class ActivateAccountView(View):
+    def get(self, request, uidb64, token):
+        try:
+            uid = force_str(urlsafe_base64_decode(uidb64))
+            user = User.objects.get(pk=uid)
+        except (TypeError, ValueError, OverflowError, User.DoesNotExist):
+            user = None
+
+        if user is not None and default_token_generator.check_token(user, token):
+            user.is_active = True
+            user.save()
+            messages.success(request, 'Twoje Konto zostało aktywowane, możesz się teraz zalogować.')
+            return redirect('Login')
+        else:
+            messages.error(request, 'Link aktywacyjny był niepoprawny!')
+            return redirect('Register')
+
+
+class CustomPasswordResetConfirmView(PasswordResetConfirmView):
+    form_class = CustomSetPasswordForm
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
 from django.utils.translation import gettext_lazy as _
 
-from charity_donations.models import Institution
+from charity_donations.models import ContactMessage, DonationStatusChange, Institution
 
 
 class CustomUserAdmin(UserAdmin):
@@ -26,9 +26,12 @@ admin.site.register(User, CustomUserAdmin)
 
 
 class InstitutionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'type_display')  # Customize the list display in the admin panel
+    list_display = ('name', 'description', 'type_display', 'total_bags', 'donation_count',
+                    'last_donation_date')  # Customize the list display in the admin panel
     list_filter = ('type', 'categories')  # Filtering by type and categories
     search_fields = ('name', 'description')  # Add search functionality based on name and description
+    ordering = ('-total_bags', '-donation_count')  # Most supported first, uses the institution_most_supported index
+    readonly_fields = Institution.COUNTER_FIELDS  # Maintained from donations, Institution.save() leaves them alone
 
     def type_display(self, obj):
         return obj.get_type_display()
@@ -37,3 +40,42 @@ class InstitutionAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Institution, InstitutionAdmin)
+
+
+class ContactMessageAdmin(admin.ModelAdmin):
+    list_display = ('name', 'surname', 'created_at', 'claimed_at', 'sent_at')
+    list_filter = ('sent_at',)  # "No date" shows the messages waiting for the next digest
+    search_fields = ('name', 'surname', 'message')
+    readonly_fields = ('created_at', 'claimed_at', 'sent_at')
+    date_hierarchy = 'created_at'
+
+    def changelist_view(self, request, extra_context=None):
+        pending = ContactMessage.objects.filter(sent_at__isnull=True).count()
+        extra_context = {**(extra_context or {}), 'subtitle': _('%(count)d waiting for the next digest') % {
+            'count': pending}}
+        return super().changelist_view(request, extra_context)
+
+
+admin.site.register(ContactMessage, ContactMessageAdmin)
+
+
+class DonationStatusChangeAdmin(admin.ModelAdmin):
+    list_display = ('donation_id', 'is_taken', 'changed_by', 'changed_at')
+    list_filter = ('is_taken',)
+    # donation__id stays on the log table, the donation itself may be archived by now
+    search_fields = ('=donation__id', 'changed_by__username')
+    list_select_related = ('changed_by',)
+    date_hierarchy = 'changed_at'
+
+    # append-only: entries are written by audit.record_status_change and pruned by a command
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(DonationStatusChange, DonationStatusChangeAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CharityDonationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'charity_donations'
+
+    def ready(self):
+        from charity_donations import signals  # noqa: F401
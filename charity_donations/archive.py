@@ -0,0 +1,93 @@
+"""
+Archive tier for collected donations.
+
+archive_batch() moves collected donations picked up before a cutoff from the donation table to
+ArchivedDonation, their category links flattened into ids and names. An archived donation still
+counts in the rollups and institution counters, so while archive_batch deletes the donations the
+`archiving` flag is set and the signal handlers maintaining them leave them alone.
+DonationHistory pages through a user's donations, the live ones first and then the archive.
+"""
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.utils.functional import cached_property
+
+from charity_donations.models import ArchivedDonation, Donation
+
+ARCHIVED_FIELDS = ('id', 'quantity', 'institution_id', 'address', 'phone_number', 'city', 'zip_code',
+                   'pick_up_date', 'pick_up_time', 'pick_up_comment', 'user_id')
+
+# set while archive_batch deletes the donations it has copied to the archive
+archiving = ContextVar('archiving', default=False)
+
+
+def archivable(cutoff):
+    return Donation.objects.filter(is_taken=True, pick_up_date__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to batch_size archivable donations in one transaction, return how many were moved."""
+    with transaction.atomic():
+        # skip_locked: a donation being edited right now is archived by a later run
+        ids = list(archivable(cutoff).order_by('pk').select_for_update(skip_locked=True)
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+
+        links = {}
+        for donation_id, category_id, name in (Donation.categories.through.objects.filter(donation_id__in=ids)
+                                               .order_by('category_id')
+                                               .values_list('donation_id', 'category_id', 'category__name')):
+            links.setdefault(donation_id, []).append((category_id, name))
+
+        ArchivedDonation.objects.bulk_create(
+            ArchivedDonation(
+                **row,
+                category_ids=[category_id for category_id, _ in links.get(row['id'], ())],
+                category_names=', '.join(name for _, name in links.get(row['id'], ())),
+            )
+            for row in Donation.objects.filter(pk__in=ids).values(*ARCHIVED_FIELDS)
+        )
+
+        # the delete takes the category links along
+        token = archiving.set(True)
+        try:
+            Donation.objects.filter(pk__in=ids).delete()
+        finally:
+            archiving.reset(token)
+    return len(ids)
+
+
+class DonationHistory:
+    """
+    The donations of a user, newest pick-up first: the donation table, then the archive.
+
+    Sliceable and countable, so it can be given to Paginator. Besides its count, the archive is
+    only read for the pages past the live donations.
+    """
+
+    def __init__(self, user):
+        self.recent = (Donation.objects.filter(user=user).order_by('-pick_up_date', '-pk')
+                       .select_related('institution').prefetch_related('categories'))
+        self.archived = (ArchivedDonation.objects.filter(user=user).order_by('-pick_up_date', '-pk')
+                         .select_related('institution'))
+
+    @cached_property
+    def recent_count(self):
+        return self.recent.count()
+
+    def count(self):
+        return self.recent_count + self.archived.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('DonationHistory only supports slicing.')
+        start, stop = index.start or 0, index.stop
+        recent_count = self.recent_count
+        # a page within one of the tables stays a lazy queryset
+        if stop is not None and stop <= recent_count:
+            return self.recent[start:stop]
+        archived = self.archived[max(start - recent_count, 0):None if stop is None else stop - recent_count]
+        if start >= recent_count:
+            return archived
+        return [*self.recent[start:], *archived]
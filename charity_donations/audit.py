@@ -0,0 +1,46 @@
+"""
+Batched writes of the donation status audit log (DonationStatusChange).
+
+record_status_change() adds the event to a batch of the current transaction; the first event
+registers an on_commit hook that writes the whole batch with one bulk_create. When the transaction
+is rolled back the hook is dropped and the next event starts a new batch. Events are kept even if
+only a savepoint around them is rolled back, so record a change after the write that made it.
+Outside a transaction the event is written at once.
+"""
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from charity_donations.models import DonationStatusChange
+
+
+class StatusChangeBatch:
+    def __init__(self, using):
+        self.using = using
+        self.events = []
+
+    def flush(self):
+        events, self.events = self.events, []
+        DonationStatusChange.objects.using(self.using).bulk_create(events)
+
+
+def pending_batch(using):
+    """The batch whose hook is still registered for the current transaction, if any."""
+    connection = transaction.get_connection(using)
+    batch = getattr(connection, 'status_change_batch', None)
+    if batch is not None and any(getattr(hook, '__self__', None) is batch for _, hook, _ in connection.run_on_commit):
+        return batch
+    return None
+
+
+def record_status_change(donation, changed_by, using=DEFAULT_DB_ALIAS):
+    """Log the current is_taken of donation, changed by the given user, once the transaction commits."""
+    event = DonationStatusChange(donation_id=donation.pk, is_taken=donation.is_taken,
+                                 changed_by=changed_by if changed_by and changed_by.is_authenticated else None)
+    batch = pending_batch(using)
+    if batch is None:
+        batch = StatusChangeBatch(using)
+        transaction.get_connection(using).status_change_batch = batch
+        batch.events.append(event)
+        # robust: the donations are committed already, a failed audit write must not become an error page
+        transaction.on_commit(batch.flush, using=using, robust=True)
+    else:
+        batch.events.append(event)
@@ -0,0 +1,41 @@
+"""
+Batched maintenance for the management commands: each batch runs in a short transaction of its
+own and the commands pause between batches, so other writers get the locks in between.
+"""
+import time
+
+from django.db import transaction
+
+
+def add_batch_arguments(parser, batch_size):
+    parser.add_argument('--batch-size', type=int, default=batch_size)
+    parser.add_argument('--sleep', type=float, default=0.5,
+                        help='Seconds to wait between batches so other writers can get the locks.')
+
+
+def run_in_batches(batch, batch_size, sleep):
+    """Call batch(batch_size), which returns how many rows it handled, until a batch comes up short."""
+    while batch(batch_size) >= batch_size:
+        time.sleep(sleep)
+
+
+def delete_in_batches(queryset, batch_size, sleep, stdout, label):
+    """Delete the rows of queryset batch by batch, return how many were deleted."""
+    deleted = 0
+    last_pk = None
+
+    def batch(size):
+        nonlocal deleted, last_pk
+        # walk the primary key instead of re-filtering from the start on every batch
+        rows = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(rows.order_by('pk').values_list('pk', flat=True)[:size])
+        if pks:
+            with transaction.atomic():
+                # the conditions are checked again, a row may have changed meanwhile
+                deleted += queryset.filter(pk__in=pks).delete()[1].get(queryset.model._meta.label, 0)
+            last_pk = pks[-1]
+            stdout.write(f'{label}: {deleted} deleted so far')
+        return len(pks)
+
+    run_in_batches(batch, batch_size, sleep)
+    return deleted
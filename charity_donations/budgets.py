@@ -0,0 +1,115 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUE_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Normalize a query so that the same statement with different values groups together."""
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = VALUE_LIST_RE.sub('(...)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class BudgetTracker:
+    """Counts queries on every database connection and times the wrapped block."""
+
+    def __init__(self, name, max_queries=None, max_duration_ms=None):
+        self.name = name
+        self.max_queries = max_queries
+        self.max_duration_ms = max_duration_ms
+        self.queries = []
+        self.duration_ms = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        self._stack.close()
+        if exc_type is None:
+            self.check()
+
+    def query_violations(self):
+        if self.max_queries is not None and len(self.queries) > self.max_queries:
+            return [f'{len(self.queries)} queries > {self.max_queries}']
+        return []
+
+    def duration_violations(self):
+        if self.max_duration_ms is not None and self.duration_ms > self.max_duration_ms:
+            return [f'{self.duration_ms:.0f} ms > {self.max_duration_ms} ms']
+        return []
+
+    def report(self, violations):
+        return {
+            'budget': self.name,
+            'violations': violations,
+            'queries': len(self.queries),
+            'max_queries': self.max_queries,
+            'duration_ms': round(self.duration_ms, 1),
+            'max_duration_ms': self.max_duration_ms,
+            'fingerprints': Counter(fingerprint(sql) for sql in self.queries).most_common(5),
+        }
+
+    def check(self):
+        query_violations, duration_violations = self.query_violations(), self.duration_violations()
+        violations = query_violations + duration_violations
+        if not violations:
+            return
+
+        report = self.report(violations)
+        # wall-clock time depends on the machine, so by default only the query count fails loudly
+        if settings.QUERY_BUDGET_RAISE and (query_violations or settings.QUERY_BUDGET_RAISE_ON_DURATION):
+            raise BudgetExceeded(json.dumps(report, indent=2))
+        if random.random() < settings.QUERY_BUDGET_SAMPLE_RATE:
+            logger.warning(json.dumps(report), extra={'budget': report})
+
+
+def query_budget(max_queries=None, max_duration_ms=None):
+    """
+    Declare the query count and latency a view (or view method) may use, including
+    template rendering. Raises BudgetExceeded when QUERY_BUDGET_RAISE is on (tests, staging) -
+    for a slow response only with QUERY_BUDGET_RAISE_ON_DURATION too - otherwise logs a sampled
+    warning with the most frequent SQL fingerprints.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # works for plain views and for methods of class-based views
+            request = next((arg for arg in args if isinstance(arg, HttpRequest)), None)
+            name = view.__qualname__ if request is None else f'{view.__qualname__} {request.path}'
+            with BudgetTracker(name, max_queries, max_duration_ms):
+                return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,104 @@
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.db import connections, transaction
+
+from charity_donations.models import Category, DataVersion, Institution
+from charity_donations.versioning import get_versions
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    Categories and institutions (with their categories prefetched) as of one catalog version.
+    Shared by all threads of the worker, so the model instances in it must be treated as read-only.
+
+    Each category gets a bit and category_masks holds, parallel to institutions, the bitmask of the
+    categories each institution accepts, so filtering by categories is one AND per institution.
+    """
+    version: tuple
+    categories: tuple
+    institutions: tuple
+    institutions_by_type: MappingProxyType
+    category_bits: MappingProxyType
+    category_masks: tuple
+
+    def category_mask(self, category_ids):
+        """The bitmask of the given category ids, None if one of them is not in the catalog."""
+        mask = 0
+        for category_id in category_ids:
+            bit = self.category_bits.get(category_id)
+            if bit is None:
+                return None
+            mask |= 1 << bit
+        return mask
+
+    def institutions_covering(self, category_ids):
+        """Institutions accepting all of the given categories, in pk order."""
+        wanted = self.category_mask(category_ids)
+        if wanted is None:
+            return ()
+        return tuple(institution for institution, mask in zip(self.institutions, self.category_masks)
+                     if mask & wanted == wanted)
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def load_catalog(version):
+    # always the primary: a lagging replica would store old rows under the new version
+    connection = connections['default']
+    outermost = not connection.in_atomic_block
+    # no savepoint inside a caller's transaction, the loads only read
+    with transaction.atomic(using='default', savepoint=False):
+        if outermost and connection.vendor == 'postgresql':
+            # the three queries see one state of the catalog, like SQLite's transactions always do
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        categories = tuple(Category.objects.using('default').order_by('pk'))
+        institutions = tuple(Institution.objects.using('default').order_by('pk').prefetch_related('categories'))
+
+    category_bits = {category.pk: bit for bit, category in enumerate(categories)}
+    by_type = {institution_type: [] for institution_type, _ in Institution.INSTITUTION_TYPES}
+    masks = []
+    for institution in institutions:
+        institution.category_ids = tuple(category.id for category in institution.categories.all())
+        mask = 0
+        for category_id in institution.category_ids:
+            # loaded inside a caller's READ COMMITTED transaction a new category can be linked
+            # already; the catalog version bump of that change reloads the snapshot
+            if category_id in category_bits:
+                mask |= 1 << category_bits[category_id]
+        masks.append(mask)
+        by_type.setdefault(institution.type, []).append(institution)
+
+    return CatalogSnapshot(
+        version=version,
+        categories=categories,
+        institutions=institutions,
+        institutions_by_type=MappingProxyType({key: tuple(value) for key, value in by_type.items()}),
+        category_bits=MappingProxyType(category_bits),
+        category_masks=tuple(masks),
+    )
+
+
+def get_catalog():
+    """
+    Return the catalog snapshot, reloading it only when the catalog version changed.
+
+    The version lives in DataVersion and is cached for DATA_VERSION_CACHE_TIMEOUT, so in steady
+    state this runs no queries at all. The update time is part of the key, a version number that
+    was rolled back and reused must not match an old snapshot.
+    """
+    global _snapshot
+    version = get_versions([DataVersion.CATALOG])[DataVersion.CATALOG]
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = load_catalog(version)
+        return _snapshot
@@ -2,15 +2,52 @@ from datetime import date, time
 
 import pytest
 from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
 from django.contrib.auth.tokens import default_token_generator
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
 from django.urls import reverse
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
+from charity_donations import catalog, routers
 from charity_donations.models import Category, Institution, Donation
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # the locmem cache outlives the per-test database rollback
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_catalog_snapshot(monkeypatch):
+    # data versions of rolled back tests repeat, a snapshot must not outlive its test
+    monkeypatch.setattr(catalog, '_snapshot', None)
+
+
+@pytest.fixture(autouse=True)
+def clear_replica_latencies(monkeypatch):
+    # the measured replica latencies are per process, every test starts without any
+    monkeypatch.setattr(routers, '_latencies', {})
+
+
+@pytest.fixture(autouse=True)
+def lenient_static_manifest(settings):
+    # most tests render pages without running collectstatic first
+    settings.STATIC_MANIFEST_STRICT = False
+
+
+@pytest.fixture(autouse=True)
+def enforce_query_budgets(settings):
+    # query counts fail the tests, latencies stay sampled warnings on slow runners
+    settings.QUERY_BUDGET_RAISE = True
+    settings.QUERY_BUDGET_RAISE_ON_DURATION = False
+
+
 @pytest.fixture
 def user():
     return User.objects.create_user(
@@ -41,47 +78,51 @@ def superusers():
 
 
 @pytest.fixture
-def categories():
+def categories(django_capture_on_commit_callbacks):
     categories = []
-    for i in range(10):
-        category = Category.objects.create(name=f'category{i}')
-        categories.append(category)
+    # the fixture data counts as committed, the data versions are bumped after commit
+    with django_capture_on_commit_callbacks(execute=True):
+        for i in range(10):
+            category = Category.objects.create(name=f'category{i}')
+            categories.append(category)
     return categories
 
 
 @pytest.fixture
-def institutions(categories):
+def institutions(categories, django_capture_on_commit_callbacks):
     institutions = []
-    for i in range(10):
-        institution = Institution.objects.create(
-            name=f'Institution {i}',
-            type=Institution.FOUNDATION,
-            description='Some description'
-        )
-        institution.categories.set(categories)
-        institutions.append(institution)
+    with django_capture_on_commit_callbacks(execute=True):
+        for i in range(10):
+            institution = Institution.objects.create(
+                name=f'Institution {i}',
+                type=Institution.FOUNDATION,
+                description='Some description'
+            )
+            institution.categories.set(categories)
+            institutions.append(institution)
     return institutions
 
 
 @pytest.fixture
-def donations(institutions, categories, user):
+def donations(institutions, categories, user, django_capture_on_commit_callbacks):
     donations = []
-    for i in range(10):
-        donation = Donation.objects.create(
-            quantity=7,
-            institution=institutions[i % len(institutions)],
-            address=f'Street {i}',
-            phone_number=f'123456789{i}',
-            city='City',
-            zip_code='12345',
-            pick_up_date=date.today(),
-            pick_up_time=time(hour=10, minute=0),
-            pick_up_comment=f'Comment for Donation {i}',
-            user=user,
-            is_taken=False
-        )
-        donation.categories.set(categories)
-        donations.append(donation)
+    with django_capture_on_commit_callbacks(execute=True):
+        for i in range(10):
+            donation = Donation.objects.create(
+                quantity=7,
+                institution=institutions[i % len(institutions)],
+                address=f'Street {i}',
+                phone_number=f'123456789{i}',
+                city='City',
+                zip_code='12345',
+                pick_up_date=date.today(),
+                pick_up_time=time(hour=10, minute=0),
+                pick_up_comment=f'Comment for Donation {i}',
+                user=user,
+                is_taken=False
+            )
+            donation.categories.set(categories)
+            donations.append(donation)
     return donations
 
 
@@ -101,3 +142,23 @@ def activation_data(user):
 def activate_url(activation_data):
     uid, token = activation_data
     return reverse('ActivateAccount', kwargs={'uidb64': uid, 'token': token})
+
+
+@pytest.fixture(scope='session')
+def collected_static(tmp_path_factory):
+    # collectstatic with compression is slow, so it runs once per test session
+    root = tmp_path_factory.mktemp('static')
+    with override_settings(STATIC_ROOT=root):
+        call_command('collectstatic', interactive=False, verbosity=0)
+    return root
+
+
+@pytest.fixture
+def static_root(settings, collected_static):
+    settings.STATIC_ROOT = collected_static
+    return collected_static
+
+
+@pytest.fixture
+def hashed_style_url(static_root):
+    return staticfiles_storage.url('css/style.css')
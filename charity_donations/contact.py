@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from charity_donations.models import ContactMessage
+
+RECIPIENTS_CACHE_KEY = 'contact-recipients'
+FROM_EMAIL = 'noreply@charity.com'
+
+
+def get_contact_recipients():
+    """E-mail addresses of all superusers, cached until a user changes (see signals)."""
+    recipients = cache.get(RECIPIENTS_CACHE_KEY)
+    if recipients is None:
+        recipients = list(User.objects.filter(is_superuser=True).exclude(email='')
+                          .order_by('pk').values_list('email', flat=True))
+        cache.set(RECIPIENTS_CACHE_KEY, recipients, settings.CONTACT_RECIPIENTS_CACHE_TIMEOUT)
+    return recipients
+
+
+def invalidate_contact_recipients():
+    cache.delete(RECIPIENTS_CACHE_KEY)
+
+
+def format_digest(contact_messages):
+    subject = f"Contact form digest: {len(contact_messages)} new message(s)"
+    parts = [
+        f"[{contact_message.created_at:%Y-%m-%d %H:%M}] {contact_message.name} {contact_message.surname}\n\n"
+        f"{contact_message.message}"
+        for contact_message in contact_messages
+    ]
+    return subject, ('\n\n' + '-' * 40 + '\n\n').join(parts)
+
+
+def send_contact_digest(limit=None):
+    """
+    Mail the pending contact messages to every superuser as one e-mail with all of them in Bcc,
+    and mark the messages as sent. Returns (messages, recipients).
+
+    The messages are claimed (claimed_at) and the claim committed before anything is mailed, so no
+    row lock is held over the SMTP round trip and overlapping runs do not mail them twice. sent_at
+    is only set once the e-mail went out. A failed send drops the claim; the claim of a run that
+    died in between expires after CONTACT_DIGEST_CLAIM_TIMEOUT and a later run retries.
+    """
+    recipients = get_contact_recipients()
+    if not recipients:
+        # keep the backlog until there is someone to send it to
+        return 0, 0
+
+    claimed_at = timezone.now()
+    expired = claimed_at - timedelta(seconds=settings.CONTACT_DIGEST_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        # skip_locked lets two overlapping runs split the backlog instead of sending it twice
+        pending = (ContactMessage.objects.filter(sent_at__isnull=True)
+                   .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=expired))
+                   .order_by('created_at').select_for_update(skip_locked=True))
+        contact_messages = list(pending[:limit] if limit else pending)
+        if not contact_messages:
+            return 0, 0
+        claimed = ContactMessage.objects.filter(pk__in=[contact_message.pk for contact_message in contact_messages])
+        claimed.update(claimed_at=claimed_at)
+
+    subject, body = format_digest(contact_messages)
+    # one message: the SMTP server takes it for all recipients or for none, so a failure never
+    # leaves some of them with a digest that the retry would send again
+    email = EmailMessage(subject, body, FROM_EMAIL, bcc=recipients)
+    try:
+        email.send()
+    except Exception:
+        claimed.filter(claimed_at=claimed_at).update(claimed_at=None)
+        raise
+    claimed.update(sent_at=timezone.now())
+    return len(contact_messages), len(recipients)
@@ -0,0 +1,27 @@
+from django.http import HttpResponse
+from django.shortcuts import render, redirect
+from django.views import View
+
+from charity_donations.forms import ContactForm
+from charity_donations.models import ContactMessage
+
+# The contact form, loaded on first use (see urls.lazy_view)
+
+
+class ContactView(View):
+    def post(self, request):
+        form = ContactForm(request.POST)
+        if form.is_valid():
+            name = form.cleaned_data['name']
+            surname = form.cleaned_data['surname']
+            message = form.cleaned_data['message']
+            # mailed to the superusers in batches by the send_contact_digest command
+            ContactMessage.objects.create(name=name, surname=surname, message=message)
+            return redirect('SuccessMessage')
+        else:
+            return HttpResponse("Something went terribly wrong and we could not submit the message")
+
+
+class SuccessMessageView(View):
+    def get(self, request):
+        return render(request, 'success_message.html')
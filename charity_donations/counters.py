@@ -0,0 +1,62 @@
+"""
+Per-institution donation counters (Institution.total_bags, donation_count, last_donation_date).
+
+Donation signals call these with the (day, institution_id, city, bags) state tracked for the
+rollups, see signals.py. Updates are single UPDATE statements with F() expressions, so concurrent
+donations for the same institution never overwrite each other. Archived donations keep counting.
+"""
+from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from charity_donations.models import ArchivedDonation, Donation, Institution
+
+
+def add_donation(state):
+    day, institution_id, _, bags = state
+    day = Value(day, output_field=models.DateField())
+    Institution.objects.filter(pk=institution_id).update(
+        total_bags=F('total_bags') + bags,
+        donation_count=F('donation_count') + 1,
+        # SQLite's MAX() returns NULL when any argument is NULL
+        last_donation_date=Greatest(Coalesce(F('last_donation_date'), day), day),
+    )
+
+
+def remove_donation(state, exclude_pk):
+    day, institution_id, _, bags = state
+    institutions = Institution.objects.filter(pk=institution_id)
+    institutions.update(total_bags=F('total_bags') - bags, donation_count=F('donation_count') - 1)
+    if institutions.filter(last_donation_date=day).exists():
+        # the last date can't be decremented, look it up again (uses the institution_id indexes)
+        remaining = Donation.objects.filter(institution_id=institution_id).exclude(pk=exclude_pk)
+        archived = ArchivedDonation.objects.filter(institution_id=institution_id)
+        dates = [queryset.aggregate(last=models.Max('pick_up_date'))['last'] for queryset in (remaining, archived)]
+        institutions.update(last_donation_date=max(filter(None, dates), default=None))
+
+
+def move_donation(old_state, new_state, pk):
+    if old_state == new_state:
+        return
+    remove_donation(old_state, pk)
+    add_donation(new_state)
+
+
+def expected_counters(institution_id=None):
+    """{institution_id: counters} recomputed from the donations and the archive."""
+    expected = {}
+    for model in (Donation, ArchivedDonation):
+        rows = model.objects.order_by()
+        if institution_id is not None:
+            rows = rows.filter(institution_id=institution_id)
+        rows = rows.values('institution').annotate(
+            total_bags=models.Sum('quantity'), donation_count=models.Count('id'),
+            last_donation_date=models.Max('pick_up_date'))
+        for row in rows:
+            counters = expected.setdefault(row['institution'], {
+                'total_bags': 0, 'donation_count': 0, 'last_donation_date': None})
+            counters['total_bags'] += row['total_bags']
+            counters['donation_count'] += row['donation_count']
+            counters['last_donation_date'] = max(filter(None, (counters['last_donation_date'],
+                                                               row['last_donation_date'])), default=None)
+    return expected
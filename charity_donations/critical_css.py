@@ -0,0 +1,219 @@
+"""
+Critical CSS of the pages whose header fills the first screen (CRITICAL_CSS_TEMPLATES).
+
+build_critical_css renders each template, keeps the rules of style.css that can apply to <html>,
+<body> and the <header> subtree and writes them to CRITICAL_CSS_DIR under the hash of the
+stylesheet and template sources. The {% stylesheet %} tag inlines the file of the current
+template and loads the full stylesheet asynchronously; a template without a file for its current
+hash - not built yet, or changed since - gets the plain blocking stylesheet.
+"""
+import functools
+import hashlib
+import posixpath
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles import finders
+from django.template import Context
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode
+from django.templatetags.static import static
+
+STYLESHEET = 'css/style.css'
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+COMPOUND_RE = re.compile(r'([#.]?)(-?[_a-zA-Z][-_a-zA-Z0-9]*|\*)')
+# state and structure pseudo-classes are ignored, the rule is kept if the element exists at all
+PSEUDO_RE = re.compile(r'::?[-a-zA-Z]+(\([^)]*\))?')
+ATTRIBUTE_RE = re.compile(r'\[[^\]]*\]')
+KEYFRAMES_RE = re.compile(r'@(-[a-z]+-)?keyframes\s+([-\w]+)')
+
+
+def template_sources(template_name):
+    template = get_template(template_name).template
+    sources = [template.source]
+    for node in template.nodelist.get_nodes_by_type(ExtendsNode):
+        sources.extend(template_sources(node.parent_name.resolve(Context())))
+    return sources
+
+
+def load_stylesheet():
+    return Path(finders.find(STYLESHEET)).read_text()
+
+
+def source_hash(template_name):
+    digest = hashlib.sha256(load_stylesheet().encode())
+    for source in template_sources(template_name):
+        digest.update(source.encode())
+    return digest.hexdigest()[:12]
+
+
+def css_path(template_name, digest):
+    return Path(settings.CRITICAL_CSS_DIR) / f'{template_name.replace("/", "-")}.{digest}.css'
+
+
+class FoldElements(HTMLParser):
+    """Collects (tag, id, classes) of <html>, <body> and everything inside <header>."""
+
+    def __init__(self):
+        super().__init__()
+        self.elements = []
+        self.header_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'header' or self.header_depth or tag in ('html', 'body'):
+            self.elements.append((tag, attrs.get('id'), set((attrs.get('class') or '').split())))
+        if (tag == 'header' or self.header_depth) and tag not in VOID_ELEMENTS:
+            self.header_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if (tag == 'header' or self.header_depth) and tag not in VOID_ELEMENTS:
+            self.header_depth -= 1
+
+    def handle_endtag(self, tag):
+        if self.header_depth and tag not in VOID_ELEMENTS:
+            self.header_depth -= 1
+
+
+def split_top_level(text, separator):
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append(''.join(current))
+    return parts
+
+
+def compound_matches(compound, elements):
+    tag, element_id, classes = None, None, set()
+    for prefix, name in COMPOUND_RE.findall(compound):
+        if prefix == '#':
+            element_id = name
+        elif prefix == '.':
+            classes.add(name)
+        elif name != '*':
+            tag = name.lower()
+    return any((tag is None or tag == other_tag) and (element_id is None or element_id == other_id)
+               and classes <= other_classes for other_tag, other_id, other_classes in elements)
+
+
+def selector_matches(selector, elements):
+    # every compound must match some element; ancestors are not checked, so this keeps a superset
+    selector = ATTRIBUTE_RE.sub('', PSEUDO_RE.sub('', selector))
+    compounds = re.split(r'\s*[>+~]\s*|\s+', selector.strip())
+    return all(compound_matches(compound, elements) for compound in compounds if compound)
+
+
+def parse_blocks(css):
+    """Yield (prelude, body) of the top level rules, body None for statements like @import."""
+    position = 0
+    while position < len(css):
+        brace, semicolon = css.find('{', position), css.find(';', position)
+        if brace == -1:
+            return
+        if semicolon != -1 and semicolon < brace and css[position:semicolon].strip().startswith('@'):
+            yield css[position:semicolon].strip(), None
+            position = semicolon + 1
+            continue
+        depth, end = 1, brace + 1
+        while depth and end < len(css):
+            depth += {'{': 1, '}': -1}.get(css[end], 0)
+            end += 1
+        yield css[position:brace].strip(), css[brace + 1:end - 1].strip()
+        position = end
+
+
+def extract(css, elements):
+    """The rules of css that can apply to the given elements, @media blocks kept around them."""
+    rules, keyframes = [], {}
+    for prelude, body in parse_blocks(COMMENT_RE.sub('', css)):
+        prelude = ' '.join(prelude.split())
+        if body is None:
+            # @import and @charset - the fonts come with the full stylesheet
+            continue
+        if prelude.startswith(('@media', '@supports')):
+            inner = extract(body, elements)
+            if inner:
+                rules.append(f'{prelude}{{{inner}}}')
+        elif match := KEYFRAMES_RE.match(prelude):
+            keyframes[match.group(2)] = f'{prelude}{{{body}}}'
+        elif prelude.startswith('@'):
+            continue
+        elif any(selector_matches(selector, elements) for selector in split_top_level(prelude, ',')):
+            rules.append(f'{prelude}{{{" ".join(body.split())}}}')
+    critical = ''.join(rules)
+    used = [animation for name, animation in keyframes.items() if re.search(rf'\b{re.escape(name)}\b', critical)]
+    return critical + ''.join(used)
+
+
+def render_fold(template_name):
+    """The fold elements of a template rendered for a visitor and for a staff superuser."""
+    # only the build command renders, the pages never import the test client
+    from django.test import RequestFactory
+
+    elements = []
+    for user in (AnonymousUser(), User(username='critical', is_staff=True, is_superuser=True)):
+        request = RequestFactory().get('/')
+        request.user = user
+        parser = FoldElements()
+        parser.feed(get_template(template_name).render({}, request))
+        elements.extend(parser.elements)
+    return elements
+
+
+def build(template_name):
+    """Write the critical CSS of a template, return its path."""
+    path = css_path(template_name, source_hash(template_name))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(extract(load_stylesheet(), render_fold(template_name)))
+    cached_load.cache_clear()
+    return path
+
+
+def stylesheet_asset(url):
+    """The static path of a url() in the stylesheet, None for data:, absolute and external URLs."""
+    if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+        return None
+    return posixpath.normpath(posixpath.join(posixpath.dirname(STYLESHEET), url))
+
+
+def absolute_urls(css):
+    # url(../images/x.jpg) is relative to the stylesheet, inlined it must point at the static file
+    def replace(match):
+        path = stylesheet_asset(match.group(2))
+        return match.group(0) if path is None else f'url("{static(path)}")'
+
+    return URL_RE.sub(replace, css)
+
+
+def load(template_name):
+    """The critical CSS for the current sources of a template, None when it has not been built."""
+    try:
+        css = css_path(template_name, source_hash(template_name)).read_text()
+    except FileNotFoundError:
+        return None
+    # keep "</style>" in a rule from closing the inline element
+    return absolute_urls(css).replace('</', '<\\/')
+
+
+# once per process in production, the sources only change with a deploy
+cached_load = functools.cache(load)
+
+
+def critical_css(template_name):
+    if template_name not in settings.CRITICAL_CSS_TEMPLATES:
+        return None
+    return load(template_name) if settings.DEBUG else cached_load(template_name)
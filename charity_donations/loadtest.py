@@ -0,0 +1,242 @@
+"""
+Load generator used by the loadtest management command.
+
+Every virtual user is a thread with its own cookie jar that repeatedly picks a scenario from the
+configured mix and runs it over plain HTTP (urllib), like a browser would: it reads the CSRF token
+from the csrftoken cookie and posts the forms with it.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+SCENARIOS = ('landing', 'donation', 'profile')
+DEFAULT_MIX = {'landing': 6, 'donation': 1, 'profile': 2}
+PAGE_PARAMETERS = ('page_foundations', 'page_ngos', 'page_local_collections')
+
+CATEGORY_RE = re.compile(r'name="categories"\s+value="(\d+)"')
+IS_TAKEN_RE = re.compile(r'name="is_taken_(\d+)"\s+value="true"\s*(checked)?')
+
+
+def parse_mix(value):
+    """'landing=6,donation=1' -> {'landing': 6, 'donation': 1}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario {name!r}, choose from {", ".join(SCENARIOS)}.')
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('The mix needs at least one scenario with a positive weight.')
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+class Stats:
+    """Latencies and errors per request name, shared by all virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, duration_ms, error=None):
+        with self.lock:
+            self.latencies[name].append(duration_ms)
+            if error is not None:
+                self.errors[name][error] += 1
+
+    @staticmethod
+    def summary(latencies, errors, elapsed):
+        latencies = sorted(latencies)
+        count = len(latencies)
+        error_count = sum(errors.values())
+        return {
+            'requests': count,
+            'throughput_rps': round(count / elapsed, 2) if elapsed else None,
+            'errors': error_count,
+            'error_rate': round(error_count / count, 4) if count else 0,
+            'error_kinds': dict(errors),
+            'latency_ms': {
+                'mean': round(sum(latencies) / count, 2) if count else None,
+                **{name: None if value is None else round(value, 2) for name, value in (
+                    ('p50', percentile(latencies, 0.5)),
+                    ('p90', percentile(latencies, 0.9)),
+                    ('p95', percentile(latencies, 0.95)),
+                    ('p99', percentile(latencies, 0.99)),
+                    ('max', latencies[-1] if latencies else None),
+                )},
+            },
+        }
+
+    def report(self, elapsed, **parameters):
+        with self.lock:
+            all_latencies = [value for values in self.latencies.values() for value in values]
+            all_errors = defaultdict(int)
+            for errors in self.errors.values():
+                for kind, count in errors.items():
+                    all_errors[kind] += count
+            return {
+                'parameters': parameters,
+                'elapsed_s': round(elapsed, 2),
+                'total': self.summary(all_latencies, all_errors, elapsed),
+                'requests': {
+                    name: self.summary(latencies, self.errors.get(name, {}), elapsed)
+                    for name, latencies in sorted(self.latencies.items())
+                },
+            }
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class VirtualUser:
+    def __init__(self, base_url, stats, mix, username=None, password=None, timeout=10, seed=None):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.mix = mix
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+        self.logged_in = False
+
+    def request(self, name, path, data=None):
+        """Send one request (following redirects) and record it under name. Returns the body."""
+        body = None if data is None else urlencode(data, doseq=True).encode()
+        request = Request(self.base_url + path, data=body, headers={'User-Agent': 'charity-loadtest'})
+        start = time.perf_counter()
+        error = None
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content = response.read().decode('utf-8', 'replace')
+        except HTTPError as e:
+            error, content = f'HTTP {e.code}', None
+        except (URLError, OSError) as e:
+            error, content = type(getattr(e, 'reason', e)).__name__, None
+        self.stats.record(name, (time.perf_counter() - start) * 1000, error)
+        if content is None:
+            raise ScenarioError(error)
+        return content
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def run(self, deadline, delay=0):
+        time.sleep(delay)
+        scenarios = [name for name, weight in self.mix.items() if weight > 0]
+        weights = [self.mix[name] for name in scenarios]
+        while time.monotonic() < deadline:
+            scenario = self.random.choices(scenarios, weights)[0]
+            try:
+                getattr(self, f'scenario_{scenario}')()
+            except ScenarioError:
+                # already counted as an error, the next scenario starts from scratch
+                pass
+
+    def login(self):
+        if self.logged_in:
+            return
+        if not self.username:
+            raise ScenarioError('no credentials')
+        self.request('login_form', '/login/')
+        self.request('login', '/login/', {
+            'csrfmiddlewaretoken': self.csrf_token(), 'username': self.username, 'password': self.password,
+        })
+        self.logged_in = any(cookie.name == 'sessionid' for cookie in self.cookies)
+        if not self.logged_in:
+            raise ScenarioError('login failed')
+
+    def scenario_landing(self):
+        parameters = {name: self.random.randint(1, 4) for name in PAGE_PARAMETERS if self.random.random() < 0.5}
+        self.request('landing', '/' + (f'?{urlencode(parameters)}' if parameters else ''))
+
+    def organizations(self, categories):
+        query = urlencode({'categories': categories}, doseq=True)
+        return json.loads(self.request('donation_organizations', f'/donation/organizations/?{query}'))['results']
+
+    def scenario_donation(self):
+        self.login()
+        page = self.request('donation_form', '/donation/')
+        categories = CATEGORY_RE.findall(page)
+        if not categories:
+            raise ScenarioError('no categories')
+        # step 3 of the form lists the organizations accepting all chosen categories
+        chosen = self.random.sample(categories, self.random.randint(1, min(len(categories), 2)))
+        organizations = self.organizations(chosen)
+        if not organizations:
+            # like a visitor, go back and pick a single category
+            chosen = chosen[:1]
+            organizations = self.organizations(chosen)
+        if not organizations:
+            raise ScenarioError('no organizations')
+        organization = self.random.choice(organizations)['id']
+        pick_up = date.today() + timedelta(days=self.random.randint(1, 30))
+        self.request('donation_post', '/donation/', {
+            'csrfmiddlewaretoken': self.csrf_token(),
+            'categories': chosen,
+            'bags': self.random.randint(1, 10),
+            'organization': organization,
+            'address': 'Testowa 1',
+            'city': self.random.choice(('Warszawa', 'Kraków', 'Gdańsk', 'Poznań')),
+            'postcode': '00-001',
+            'phone': '123456789',
+            'date': pick_up.isoformat(),
+            'time': '10:00',
+            'more_info': 'loadtest',
+        })
+
+    def scenario_profile(self):
+        self.login()
+        page = self.request('profile', '/profile/')
+        donations = IS_TAKEN_RE.findall(page)
+        if not donations or self.random.random() < 0.5:
+            return
+        # the profile form posts the ids of its page and every checked box, flip one of them
+        flipped = self.random.choice(donations)[0]
+        data = {'csrfmiddlewaretoken': self.csrf_token(), 'donations': [pk for pk, _ in donations]}
+        for pk, checked in donations:
+            if bool(checked) != (pk == flipped):
+                data[f'is_taken_{pk}'] = 'true'
+        self.request('profile_toggle', '/profile/', data)
+
+
+def run_load_test(base_url, users, duration, ramp_up=0, mix=None, username=None, password=None, timeout=10,
+                  seed=None):
+    """Run the virtual users for duration seconds (ramp-up included) and return the JSON-ready report."""
+    mix = mix or DEFAULT_MIX
+    stats = Stats()
+    start = time.monotonic()
+    deadline = start + duration
+    threads = []
+    for index in range(users):
+        user = VirtualUser(base_url, stats, mix, username, password, timeout,
+                           seed=None if seed is None else seed + index)
+        # users start evenly spread over the ramp-up period
+        delay = ramp_up * index / users if users else 0
+        thread = threading.Thread(target=user.run, args=(deadline, delay), daemon=True)
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return stats.report(time.monotonic() - start, base_url=base_url, users=users, duration=duration,
+                        ramp_up=ramp_up, mix=mix)
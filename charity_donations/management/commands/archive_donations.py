@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from charity_donations.archive import archivable, archive_batch
+from charity_donations.batching import add_batch_arguments, run_in_batches
+
+
+class Command(BaseCommand):
+    help = ("Move collected donations picked up long ago from the donation table to ArchivedDonation, "
+            "in small batches with short transactions. The profile history still shows them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help='Archive collected donations picked up more than this many days ago.')
+        add_batch_arguments(parser, batch_size=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        cutoff = timezone.localdate() - timedelta(days=options['days'])
+
+        if options['dry_run']:
+            self.stdout.write(f'{archivable(cutoff).count()} donations would be archived.')
+            return
+
+        archived = 0
+
+        def batch(size):
+            nonlocal archived
+            count = archive_batch(cutoff, size)
+            archived += count
+            if count:
+                self.stdout.write(f'{archived} archived so far')
+            return count
+
+        run_in_batches(batch, options['batch_size'], options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} donations.'))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from charity_donations import critical_css
+
+
+class Command(BaseCommand):
+    help = ("Extract the critical CSS of CRITICAL_CSS_TEMPLATES into CRITICAL_CSS_DIR. Run it on deploy; "
+            "a page whose stylesheet or template changed since falls back to the blocking stylesheet.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('templates', nargs='*', help='Templates to build, all of CRITICAL_CSS_TEMPLATES by default.')
+
+    def handle(self, *args, **options):
+        templates = options['templates'] or settings.CRITICAL_CSS_TEMPLATES
+        unknown = set(templates) - set(settings.CRITICAL_CSS_TEMPLATES)
+        if unknown:
+            raise CommandError(f'Not in CRITICAL_CSS_TEMPLATES: {", ".join(sorted(unknown))}')
+
+        full_size = len(critical_css.load_stylesheet().encode())
+        for template_name in templates:
+            path = critical_css.build(template_name)
+            size = path.stat().st_size
+            self.stdout.write(self.style.SUCCESS(
+                f'{template_name}: {size / 1024:.1f} KiB of {full_size / 1024:.1f} KiB -> {path}'))
@@ -0,0 +1,51 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+# OWASP's minimum for PBKDF2-HMAC-SHA256 (2023), the recommendation never goes below it
+MIN_ITERATIONS = 600_000
+
+
+class Command(BaseCommand):
+    help = ("Benchmark PBKDF2 on this host and recommend PASSWORD_HASH_ITERATIONS for a target hashing "
+            "time. Stored hashes with another iteration count are rehashed on the next login.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250,
+                            help='Wanted time of one password hash in milliseconds.')
+        parser.add_argument('--probe-iterations', type=int, default=100_000,
+                            help='Iterations of each timed hash.')
+        parser.add_argument('--rounds', type=int, default=5, help='Timed hashes, the median is used.')
+        parser.add_argument('--min-iterations', type=int, default=MIN_ITERATIONS,
+                            help='Never recommend fewer iterations than this.')
+
+    def handle(self, *args, **options):
+        if options['target_ms'] <= 0 or options['probe_iterations'] < 1 or options['rounds'] < 1:
+            raise CommandError('--target-ms, --probe-iterations and --rounds must be positive.')
+        hasher = get_hasher('pbkdf2_sha256')
+        salt = hasher.salt()
+
+        durations = []
+        for _ in range(options['rounds']):
+            start = time.perf_counter()
+            hasher.encode('calibrate-hasher', salt, options['probe_iterations'])
+            durations.append(time.perf_counter() - start)
+        per_iteration = statistics.median(durations) / options['probe_iterations']
+
+        # round to 10k so the setting reads well, check_password() compares the exact count anyway
+        recommended = round(options['target_ms'] / 1000 / per_iteration, -4)
+        self.stdout.write(f'{per_iteration * 1e9:.1f} ns per iteration '
+                          f'({options["rounds"]} x {options["probe_iterations"]} iterations)')
+        self.stdout.write(f'current: {hasher.iterations} iterations, '
+                          f'{hasher.iterations * per_iteration * 1000:.0f} ms per hash'
+                          f'{"" if settings.PASSWORD_HASH_ITERATIONS else " (Django default)"}')
+        if recommended < options['min_iterations']:
+            self.stdout.write(self.style.WARNING(
+                f'{recommended:.0f} iterations would reach {options["target_ms"]:g} ms, '
+                f'using the minimum of {options["min_iterations"]} instead.'))
+            recommended = options['min_iterations']
+        self.stdout.write(self.style.SUCCESS(
+            f'PASSWORD_HASH_ITERATIONS={recommended:.0f}  # {recommended * per_iteration * 1000:.0f} ms per hash'))
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from charity_donations.loadtest import DEFAULT_MIX, parse_mix, run_load_test
+
+
+class Command(BaseCommand):
+    help = ("Put a running server under load with concurrent virtual users following a scripted traffic "
+            "mix (landing page pagination, login, donation form, profile toggles) and print a JSON report "
+            "with throughput, latency percentiles and error rates.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test.')
+        parser.add_argument('--users', type=int, default=10, help='Number of concurrent virtual users.')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run, ramp-up included.')
+        parser.add_argument('--ramp-up', type=float, default=0,
+                            help='Seconds over which the virtual users are started.')
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+                            help='Scenario weights, e.g. landing=6,donation=1,profile=2.')
+        parser.add_argument('--username', help='Existing active account used by the donation and profile scenarios.')
+        parser.add_argument('--password')
+        parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds.')
+        parser.add_argument('--seed', type=int, help='Make the scenario choices repeatable.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(e)
+        if options['users'] < 1 or options['duration'] <= 0:
+            raise CommandError('--users and --duration must be positive.')
+        if (mix.get('donation') or mix.get('profile')) and not (options['username'] and options['password']):
+            raise CommandError('The donation and profile scenarios need --username and --password.')
+
+        report = run_load_test(
+            options['url'], options['users'], options['duration'], options['ramp_up'], mix,
+            options['username'], options['password'], options['timeout'], options['seed'],
+        )
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            total = report['total']
+            self.stdout.write(self.style.SUCCESS(
+                f"{total['requests']} requests, {total['throughput_rps']} req/s, "
+                f"error rate {total['error_rate']:.2%}, report written to {options['output']}."))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from charity_donations import partitions
+from charity_donations.archive import archive_batch
+
+
+class Command(BaseCommand):
+    help = ("Monthly range partitioning of donations by pick_up_date on PostgreSQL: convert the table, "
+            "create future partitions, archive and detach old ones and check partition pruning of the hot queries.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['convert', 'create', 'detach', 'explain'])
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Create partitions up to this many months after the current one.')
+        parser.add_argument('--keep-months', type=int, default=24,
+                            help='detach: keep partitions of this many past months attached.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='detach: archive the collected donations of old partitions in batches of this size.')
+        parser.add_argument('--user-id', type=int, default=1, help='explain: user for the history query.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Donation partitioning needs PostgreSQL, the database is %s.' % connection.vendor)
+
+        today = timezone.localdate()
+        this_month = partitions.month_start(today)
+        detach_before = partitions.add_months(this_month, -options['keep_months'])
+
+        if options['action'] == 'detach':
+            if options['batch_size'] < 1:
+                raise CommandError('--batch-size must be at least 1.')
+            with connection.cursor() as cursor:
+                partitioned = partitions.is_partitioned(cursor)
+            if partitioned:
+                # in short transactions of their own, like archive_donations: only empty partitions are detached
+                archived = 0
+                while count := archive_batch(detach_before, options['batch_size']):
+                    archived += count
+                self.stdout.write(f'Archived {archived} collected donations of the old partitions.')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            partitioned = partitions.is_partitioned(cursor)
+            action = options['action']
+
+            if action == 'convert':
+                if partitioned:
+                    self.stdout.write('The donation table is already partitioned.')
+                    return
+                partitions.convert_table(cursor, today, options['months_ahead'])
+                names = partitions.existing_partitions(cursor)
+                self.stdout.write(self.style.SUCCESS(f'Converted the donation table into {len(names)} partitions.'))
+                return
+
+            if not partitioned:
+                raise CommandError('The donation table is not partitioned, run "partition_donations convert" first.')
+
+            if action == 'create':
+                last_month = partitions.add_months(this_month, options['months_ahead'])
+                created = partitions.ensure_partitions(cursor, this_month, last_month)
+                self.stdout.write(self.style.SUCCESS(f'Created {len(created)} partitions: {", ".join(created) or "-"}'))
+
+            elif action == 'detach':
+                detached, kept = partitions.detach_partitions(cursor, detach_before)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Detached {len(detached)} partitions: {", ".join(detached) or "-"}'))
+                if kept:
+                    self.stdout.write(self.style.WARNING(
+                        f'Kept {len(kept)} partitions holding donations not collected yet: {", ".join(kept)}'))
+
+            elif action == 'explain':
+                total = len(partitions.existing_partitions(cursor))
+                for name, scanned in partitions.explain_hot_queries(cursor, options['user_id'], today).items():
+                    self.stdout.write(f'{name}: {scanned} of {total} partitions scanned')
@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+# runs in a fresh interpreter: import the entry point, then send it one request like the first
+# request an autoscaled worker gets; prints the timings as JSON
+STARTUP_SCRIPT = '''
+import importlib, json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+module_name, path, host = sys.argv[1:4]
+application = importlib.import_module(module_name).application
+imported = time.perf_counter()
+
+if module_name.endswith('asgi'):
+    from asgiref.testing import ApplicationCommunicator
+    from asgiref.sync import async_to_sync
+
+    async def first_request():
+        communicator = ApplicationCommunicator(application, {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+            'query_string': b'', 'headers': [(b'host', host.encode())], 'server': (host, 80),
+            'client': ('127.0.0.1', 0),
+        })
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(30)
+        while True:
+            message = await communicator.receive_output(30)
+            if not message.get('more_body'):
+                break
+        return start['status']
+
+    status = async_to_sync(first_request)()
+else:
+    from wsgiref.util import setup_testing_defaults
+    environ = {'PATH_INFO': path, 'HTTP_HOST': host, 'SERVER_NAME': host}
+    setup_testing_defaults(environ)
+    statuses = []
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(body)
+    body.close()
+    status = int(statuses[0].split()[0])
+
+done = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (done - imported) * 1000,
+    'status': status,
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def parse_importtime(output):
+    """
+    Parse `python -X importtime` output into (module, self_us, cumulative_us, depth) in import order.
+    Modules loaded with importlib.import_module (settings, apps, the URLconf) are not logged themselves,
+    their own imports show up under the nearest logged parent.
+    """
+    imports = []
+    for line in output.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def import_row(module, self_us, cumulative_us, depth):
+    return {'module': module, 'self_ms': round(self_us / 1000, 2), 'cumulative_ms': round(cumulative_us / 1000, 2)}
+
+
+class Command(BaseCommand):
+    help = ("Measure the cold start of a worker: interpreter start, importing config.wsgi/config.asgi and "
+            "serving the first request, each in a fresh process, and show the most expensive imports "
+            "(python -X importtime) including those triggered by the first request.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='config.wsgi', choices=('config.wsgi', 'config.asgi'))
+        parser.add_argument('--path', default='/', help='Path of the first request.')
+        parser.add_argument('--repeat', type=int, default=5, help='Cold starts to measure, the median is shown.')
+        parser.add_argument('--top', type=int, default=25, help='Number of imports to list.')
+        parser.add_argument('--host', help='Host header of the first request, defaults to the first ALLOWED_HOSTS entry.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def host(self, options):
+        if options['host']:
+            return options['host']
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.')
+        return 'localhost'
+
+    def run_startup(self, options, importtime=False):
+        command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', STARTUP_SCRIPT,
+                   options['module'], options['path'], self.host(options)]
+        # workers run from compiled .pyc files, let the warm-up run write them
+        env = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            raise CommandError(f'The startup run failed:\n{result.stderr[-2000:]}')
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        timings['total_ms'] = wall_ms
+        return timings, result.stderr
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        # a warm-up run so that every measured run finds the .pyc files and the OS file cache ready
+        self.run_startup(options)
+        runs = [self.run_startup(options)[0] for _ in range(options['repeat'])]
+        _, importtime_output = self.run_startup(options, importtime=True)
+        imports = parse_importtime(importtime_output)
+
+        report = {
+            'module': options['module'],
+            'path': options['path'],
+            'status': runs[-1]['status'],
+            'runs': options['repeat'],
+            'modules_loaded': runs[-1]['modules'],
+            **{key: round(statistics.median(run[key] for run in runs), 1)
+               for key in ('total_ms', 'import_ms', 'first_request_ms')},
+            'top_imports': [
+                import_row(*item) for item in sorted(imports, key=lambda item: item[2], reverse=True)[:options['top']]
+            ],
+            'app_imports': [
+                import_row(*item) for item in imports if item[0].split('.')[0] in ('config', 'charity_donations')
+            ],
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{report['module']} GET {report['path']} -> {report['status']}, "
+            f"median of {report['runs']} cold starts:\n"
+            f"  process total   {report['total_ms']:8.1f} ms (interpreter start included)\n"
+            f"  import          {report['import_ms']:8.1f} ms\n"
+            f"  first request   {report['first_request_ms']:8.1f} ms\n"
+            f"  modules loaded  {report['modules_loaded']:8d}\n"
+        )
+        self.stdout.write('Most expensive imports (cumulative, -X importtime inflates the numbers):')
+        for item in report['top_imports']:
+            self.stdout.write(f"  {item['cumulative_ms']:8.2f} ms  {item['self_ms']:8.2f} ms self  {item['module']}")
+        self.stdout.write('Project modules:')
+        for item in report['app_imports']:
+            self.stdout.write(f"  {item['cumulative_ms']:8.2f} ms  {item['self_ms']:8.2f} ms self  {item['module']}")
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from charity_donations.batching import add_batch_arguments, delete_in_batches
+from charity_donations.models import DonationStatusChange
+
+
+class Command(BaseCommand):
+    help = ("Apply the retention of the donation status audit log: delete entries older than "
+            "DONATION_AUDIT_RETENTION_DAYS and compact those older than DONATION_AUDIT_COMPACT_DAYS "
+            "to the last change per donation and day. Works in small batches with short transactions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.DONATION_AUDIT_RETENTION_DAYS,
+                            help='Delete entries older than this many days.')
+        parser.add_argument('--compact-days', type=int, default=settings.DONATION_AUDIT_COMPACT_DAYS,
+                            help='Keep only the last change per donation and day for older entries.')
+        add_batch_arguments(parser, batch_size=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        now = timezone.now()
+        expired = DonationStatusChange.objects.filter(changed_at__lt=now - timedelta(days=options['days']))
+        # superseded: a later change of the same donation on the same day exists
+        later = DonationStatusChange.objects.filter(
+            Q(changed_at__gt=OuterRef('changed_at')) | Q(changed_at=OuterRef('changed_at'), pk__gt=OuterRef('pk')),
+            donation_id=OuterRef('donation_id'),
+            changed_at__date=OuterRef('day'),
+        )
+        superseded = (DonationStatusChange.objects
+                      .filter(changed_at__lt=now - timedelta(days=options['compact_days']))
+                      .annotate(day=TruncDate('changed_at'))
+                      .filter(Exists(later)))
+
+        if options['dry_run']:
+            self.stdout.write(f'{expired.count()} expired entries would be deleted.')
+            self.stdout.write(f'{superseded.exclude(pk__in=expired.values("pk")).count()} superseded entries '
+                              f'would be compacted.')
+            return
+
+        deleted = delete_in_batches(expired, options['batch_size'], options['sleep'], self.stdout, 'expired')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired entries.'))
+        deleted = delete_in_batches(superseded, options['batch_size'], options['sleep'], self.stdout, 'superseded')
+        self.stdout.write(self.style.SUCCESS(f'Compacted {deleted} superseded entries.'))
+
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from charity_donations.batching import add_batch_arguments, delete_in_batches
+
+DATABASE_SESSION_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+
+class Command(BaseCommand):
+    help = ("Delete accounts that were never activated (RegisterView leaves them inactive until the link "
+            "is clicked) and expired sessions, in small batches with short transactions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Only delete accounts registered more than this many days ago.')
+        add_batch_arguments(parser, batch_size=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # last_login is only set by a successful login, which LoginView refuses for inactive users;
+        # staff accounts are never touched even if an admin created them inactive
+        users = User.objects.filter(is_active=False, last_login__isnull=True, is_staff=False,
+                                    is_superuser=False, date_joined__lt=cutoff)
+        sessions = Session.objects.filter(expire_date__lt=timezone.now())
+        purge_sessions = settings.SESSION_ENGINE in DATABASE_SESSION_ENGINES
+
+        if options['dry_run']:
+            self.stdout.write(f'{users.count()} never activated accounts would be deleted.')
+            if purge_sessions:
+                self.stdout.write(f'{sessions.count()} expired sessions would be deleted.')
+            return
+
+        # the conditions are checked again in every batch, an account may have been activated meanwhile
+        deleted = delete_in_batches(users, options['batch_size'], options['sleep'], self.stdout, 'accounts')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} never activated accounts.'))
+        if purge_sessions:
+            deleted = delete_in_batches(sessions, options['batch_size'], options['sleep'], self.stdout, 'sessions')
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions.'))
+
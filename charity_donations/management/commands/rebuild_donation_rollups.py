@@ -0,0 +1,69 @@
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from charity_donations.models import ArchivedDonation, Donation, DonationRollup
+
+
+class Command(BaseCommand):
+    help = ("Recompute DonationRollup from the donations (archived ones included), e.g. after bulk "
+            "updates that bypassed the signals or when the rollups are introduced on existing data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild pick-up days from this date on (YYYY-MM-DD).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        donations = Donation.objects.all()
+        links = Donation.categories.through.objects.all()
+        archived = ArchivedDonation.objects.all()
+        rollups = DonationRollup.objects.all()
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format.')
+            donations = donations.filter(pick_up_date__gte=since)
+            links = links.filter(donation__pick_up_date__gte=since)
+            archived = archived.filter(pick_up_date__gte=since)
+            rollups = rollups.filter(day__gte=since)
+
+        # (day, institution_id, category_id, city) -> [bags, donations]
+        sums = defaultdict(lambda: [0, 0])
+        totals = (donations.order_by().values_list('pick_up_date', 'institution_id', 'city')
+                  .annotate(bags=Sum('quantity'), donations=Count('id')))
+        per_category = (links.order_by().values_list('donation__pick_up_date', 'donation__institution_id',
+                                                      'category_id')
+                        .annotate(bags=Sum('donation__quantity'), donations=Count('donation_id')))
+        archived_totals = (archived.order_by().values_list('pick_up_date', 'institution_id', 'city')
+                           .annotate(bags=Sum('quantity'), donations=Count('id')))
+
+        with transaction.atomic():
+            for day, institution_id, city, bags, count in (*totals, *archived_totals):
+                self.add(sums, (day, institution_id, None, city), bags, count)
+            for day, institution_id, category_id, bags, count in per_category:
+                self.add(sums, (day, institution_id, category_id, ''), bags, count)
+            # the archive keeps the categories flattened into a list
+            archived_links = archived.values_list('pick_up_date', 'institution_id', 'quantity', 'category_ids')
+            for day, institution_id, bags, category_ids in archived_links.iterator(chunk_size=options['batch_size']):
+                for category_id in category_ids:
+                    self.add(sums, (day, institution_id, category_id, ''), bags, 1)
+
+            deleted = rollups.delete()[0]
+            rows = [
+                DonationRollup(day=day, institution_id=institution_id, category_id=category_id, city=city,
+                               bags=bags, donations=count)
+                for (day, institution_id, category_id, city), (bags, count) in sums.items()
+            ]
+            DonationRollup.objects.bulk_create(rows, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Replaced {deleted} rollup rows with {len(rows)}.'))
+
+    @staticmethod
+    def add(sums, key, bags, count):
+        row = sums[key]
+        row[0] += bags
+        row[1] += count
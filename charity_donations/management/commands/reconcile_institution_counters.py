@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from charity_donations.counters import expected_counters
+from charity_donations.models import Institution
+
+
+class Command(BaseCommand):
+    help = ("Recompute Institution.total_bags, donation_count and last_donation_date from the donations "
+            "(archived ones included) and fix the institutions whose counters drifted (e.g. after "
+            "QuerySet.update() or raw SQL).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the differences.')
+
+    def handle(self, *args, **options):
+        expected = expected_counters()
+        empty = {'total_bags': 0, 'donation_count': 0, 'last_donation_date': None}
+
+        fixed = 0
+        for institution in Institution.objects.order_by('pk').values('pk', *empty):
+            pk = institution.pop('pk')
+            counters = expected.get(pk, empty)
+            if institution == counters:
+                continue
+            fixed += 1
+            self.stdout.write(f'Institution {pk}: {institution} -> {counters}')
+            if not options['dry_run']:
+                with transaction.atomic():
+                    # counted again under the row lock, donations may have arrived meanwhile
+                    Institution.objects.select_for_update().filter(pk=pk).get()
+                    current = expected_counters(pk).get(pk, empty)
+                    Institution.objects.filter(pk=pk).update(**current)
+
+        verb = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'{fixed} institutions {verb}.'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from charity_donations.contact import send_contact_digest
+
+
+class Command(BaseCommand):
+    help = ("Send the pending contact form messages to all superusers as one digest e-mail (Bcc). "
+            "Run it from cron every few minutes, or keep it running with --interval.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help='Maximum number of messages per digest.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and send a digest every this many minutes.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, recipients = send_contact_digest(options['limit'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} messages to {recipients} recipients.'))
+            else:
+                self.stdout.write('No messages to send.')
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'] * 60)
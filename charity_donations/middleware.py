@@ -0,0 +1,267 @@
+import mimetypes
+import os
+import re
+import time
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date, parse_http_date_safe
+
+from charity_donations import preload, user_cache
+from charity_donations.routers import request_state
+
+# file names written by ManifestStaticFilesStorage, e.g. css/style.0123456789ab.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# preferred order when the client accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def accepted_encodings(header):
+    """Return the encodings from an Accept-Encoding header that have a non-zero quality."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    Serves collected static files from STATIC_ROOT.
+
+    Picks the precompressed .br/.gz variant written by CompressedManifestStaticFilesStorage
+    according to Accept-Encoding, marks content-hashed files as immutable and supports single
+    byte-range requests. Anything that is not a collected file falls through to the next handler.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not settings.STATIC_ROOT:
+            return self.get_response(request)
+        if not request.path.startswith(settings.STATIC_URL):
+            return self.get_response(request)
+
+        name = request.path[len(settings.STATIC_URL):]
+        root = os.path.realpath(settings.STATIC_ROOT)
+        path = os.path.realpath(os.path.join(root, name))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return self.get_response(request)
+
+        return self.serve(request, name, path)
+
+    def serve(self, request, name, path):
+        stat = os.stat(path)
+        variants = [(coding, path + suffix) for coding, suffix in ENCODINGS if os.path.isfile(path + suffix)]
+        range_header = request.META.get('HTTP_RANGE')
+        selected_path, encoding = path, None
+        if not range_header:
+            # ranges are always served from the identity representation
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            for coding, variant_path in variants:
+                if coding in accepted:
+                    selected_path, encoding = variant_path, coding
+                    break
+
+        # every encoding is a representation of its own, with its own strong validator
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+        headers = {
+            'Cache-Control': self.cache_control(name),
+            'ETag': etag,
+            'Last-Modified': http_date(stat.st_mtime),
+            'Accept-Ranges': 'bytes',
+        }
+        if variants:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if self.not_modified(request, etag, stat.st_mtime):
+            response = HttpResponseNotModified()
+            for key, value in headers.items():
+                response[key] = value
+            return response
+
+        content_type, _ = mimetypes.guess_type(name)
+        content_type = content_type or 'application/octet-stream'
+
+        if range_header:
+            response = self.serve_range(range_header, path, stat.st_size, content_type)
+        else:
+            response = FileResponse(open(selected_path, 'rb'), content_type=content_type)
+            if encoding:
+                headers['Content-Encoding'] = encoding
+
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    @staticmethod
+    def cache_control(name):
+        if HASHED_NAME_RE.search(name):
+            return f'public, max-age={settings.STATIC_CACHE_MAX_AGE}, immutable'
+        # unhashed names can change between deploys, so make browsers revalidate them
+        return 'public, max-age=0, must-revalidate'
+
+    @staticmethod
+    def not_modified(request, etag, mtime):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and int(mtime) <= if_modified_since
+
+    @staticmethod
+    def serve_range(range_header, path, size, content_type):
+        match = RANGE_RE.match(range_header.strip())
+        if not match or match.groups() == ('', ''):
+            # multipart or malformed ranges - ignore them and send the whole file
+            return FileResponse(open(path, 'rb'), content_type=content_type)
+
+        start, end = match.groups()
+        if start == '':
+            # suffix range: the last N bytes
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            content = f.read(end - start + 1)
+        response = HttpResponse(content, status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request when a staff user asks for it with the `X-Profile` header or
+    the `_profile` query parameter. The cProfile dump and an HTML report with the SQL timeline
+    are stored in PROFILING_DIR and linked from the `X-Profile-Report` response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # cheap checks first, everyone else must not pay for the profiler
+        if 'HTTP_X_PROFILE' not in request.META and '_profile' not in request.GET:
+            return self.get_response(request)
+        if not (request.user.is_active and request.user.is_staff):
+            return self.get_response(request)
+
+        # cProfile and pstats are only imported once somebody actually profiles
+        from charity_donations.profiling import profile_request
+
+        response, name = profile_request(request, self.get_response)
+        response['X-Profile-Report'] = reverse('ProfilingReport', args=[f'{name}.html'])
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Keeps read-your-writes with replicas: after a request that writes, a cookie pins the
+    visitor to the primary for REPLICA_PIN_SECONDS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        try:
+            pinned_until = float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE_NAME, 0))
+        except ValueError:
+            pinned_until = 0
+        state = {'pinned': pinned_until > time.time(), 'wrote': False}
+
+        token = request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_state.reset(token)
+
+        if state['wrote']:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE_NAME,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware that loads request.user through user_cache, saving the auth_user
+    query on every authenticated request. request.auser() still goes to the database.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: self.get_user(request))
+
+    @staticmethod
+    def get_user(request):
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = user_cache.get_user(request)
+        return request._cached_user
+
+
+class PreloadLinkMiddleware:
+    """
+    Sends the assets named with the {% preload %} tag as a `Link: rel=preload` header, so browsers
+    and proxies can fetch them before parsing the page. The links are remembered per view for
+    EarlyHintsMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        links = getattr(request, '_preload_links', None)
+        if links and response.status_code == 200 and not response.has_header('Link'):
+            response['Link'] = ', '.join(links)
+            preload.remember_links(request, links)
+        return response
+
+
+class EarlyHintsMiddleware:
+    """
+    ASGI middleware sending the preload links of the requested view as 103 Early Hints while the
+    view still runs. Needs a server with the http.response.early_hint ASGI extension, and only
+    knows the links of views that have served a page in this process.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET' \
+                and 'http.response.early_hint' in scope.get('extensions', {}):
+            path = scope['path'].removeprefix(scope.get('root_path', ''))
+            links = preload.links_for_path(path)
+            if links:
+                await send({'type': 'http.response.early_hint', 'links': [link.encode() for link in links]})
+        await self.app(scope, receive, send)
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-19 17:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('charity_donations', '0004_contactmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('city', models.CharField(blank=True, max_length=255)),
+                ('bags', models.BigIntegerField(default=0)),
+                ('donations', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='charity_donations.category')),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='charity_donations.institution')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='donationrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('day', 'institution', 'category'), name='unique_category_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='donationrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('day', 'institution', 'city'), name='unique_total_rollup'),
+        ),
+    ]
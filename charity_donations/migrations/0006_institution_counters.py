@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-19 17:26
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def fill_counters(apps, schema_editor):
+    Donation = apps.get_model('charity_donations', 'Donation')
+    Institution = apps.get_model('charity_donations', 'Institution')
+    totals = Donation.objects.order_by().values('institution').annotate(
+        total_bags=Sum('quantity'), donation_count=Count('id'), last_donation_date=Max('pick_up_date'))
+    for row in totals:
+        Institution.objects.filter(pk=row.pop('institution')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('charity_donations', '0005_donationrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='institution',
+            name='donation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='institution',
+            name='last_donation_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='institution',
+            name='total_bags',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='institution',
+            index=models.Index(fields=['-total_bags', '-donation_count'], name='institution_most_supported'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
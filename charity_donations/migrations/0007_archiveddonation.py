@@ -0,0 +1,38 @@
+# Generated by Django 5.0.7 on 2026-10-19 17:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('charity_donations', '0006_institution_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDonation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField()),
+                ('category_ids', models.JSONField(default=list)),
+                ('category_names', models.TextField(blank=True)),
+                ('address', models.CharField(max_length=255)),
+                ('phone_number', models.CharField(max_length=15)),
+                ('city', models.CharField(max_length=255)),
+                ('zip_code', models.CharField(max_length=10)),
+                ('pick_up_date', models.DateField()),
+                ('pick_up_time', models.TimeField()),
+                ('pick_up_comment', models.TextField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='charity_donations.institution')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-pick_up_date', '-id'], name='archived_donation_history')],
+            },
+        ),
+    ]
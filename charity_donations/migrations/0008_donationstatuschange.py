@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-19 18:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('charity_donations', '0007_archiveddonation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonationStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_taken', models.BooleanField()),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('changed_by', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='donation_status_changes', to=settings.AUTH_USER_MODEL)),
+                ('donation', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='status_changes', to='charity_donations.donation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['donation', '-changed_at'], name='status_change_by_donation'), models.Index(fields=['changed_by', '-changed_at'], name='status_change_by_user'), models.Index(fields=['changed_at'], name='status_change_changed_at')],
+            },
+        ),
+    ]
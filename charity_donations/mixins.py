@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+class SharedCacheMixin:
+    """
+    Lets reverse proxies cache the page for anonymous visitors.
+
+    A request without a session cookie cannot be authenticated, so the session is never
+    loaded and the response gets `Cache-Control: public, s-maxage`. The template must not
+    embed a CSRF token for these visitors (see `lazy_csrf` in base.html).
+    """
+    shared_cache_max_age = None
+
+    def dispatch(self, request, *args, **kwargs):
+        anonymous = settings.SESSION_COOKIE_NAME not in request.COOKIES
+        if anonymous:
+            # AuthenticationMiddleware would otherwise read the (empty) session to find out
+            request.user = AnonymousUser()
+
+        response = super().dispatch(request, *args, **kwargs)
+
+        if anonymous and request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            s_maxage = self.shared_cache_max_age
+            if s_maxage is None:
+                s_maxage = settings.SHARED_CACHE_MAX_AGE
+            patch_cache_control(response, public=True, max_age=0, s_maxage=s_maxage)
+            # logged-in visitors send a session cookie, so they never get the shared copy
+            patch_vary_headers(response, ('Cookie',))
+        else:
+            patch_cache_control(response, private=True)
+        return response
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 
 class Category(models.Model):
@@ -24,10 +25,29 @@ class Institution(models.Model):
     description = models.TextField()
     type = models.CharField(max_length=50, choices=INSTITUTION_TYPES, default=FOUNDATION)
     categories = models.ManyToManyField(Category)
+    # denormalized from Donation by signals (see counters.py), reconcile_institution_counters fixes drift
+    total_bags = models.PositiveBigIntegerField(default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+    last_donation_date = models.DateField(null=True, blank=True)
+
+    COUNTER_FIELDS = ('total_bags', 'donation_count', 'last_donation_date')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_bags', '-donation_count'], name='institution_most_supported'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.get_type_display()}"
 
+    def save(self, *args, **kwargs):
+        # the counters are only written by UPDATEs with F() expressions; saving the values read
+        # when the instance was loaded would undo the donations counted in the meantime
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
 
 class Donation(models.Model):
     quantity = models.PositiveIntegerField()
@@ -43,5 +63,119 @@ class Donation(models.Model):
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     is_taken = models.BooleanField(default=False)
 
+    is_archived = False
+
     def __str__(self):
         return f"{self.quantity} bags for {self.institution.name}"
+
+
+class ArchivedDonation(models.Model):
+    """
+    A collected donation moved out of the donation table by the archive_donations command.
+    Keeps the id it had as a Donation, its categories are flattened into ids and names.
+    Archived donations still count in the rollups and institution counters.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    quantity = models.PositiveIntegerField()
+    category_ids = models.JSONField(default=list)
+    category_names = models.TextField(blank=True)
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE)
+    address = models.CharField(max_length=255)
+    phone_number = models.CharField(max_length=15)
+    city = models.CharField(max_length=255)
+    zip_code = models.CharField(max_length=10)
+    pick_up_date = models.DateField()
+    pick_up_time = models.TimeField()
+    pick_up_comment = models.TextField(blank=True, null=True)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+    is_taken = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-pick_up_date', '-id'], name='archived_donation_history'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} bags for {self.institution.name} (archived)"
+
+
+class DonationStatusChange(models.Model):
+    """
+    Append-only log of is_taken changes, written in batches at commit time (see audit.py).
+    The donation is referenced without a database constraint: entries outlive archived donations and
+    the partitioned donation table can't be the target of a foreign key on id alone.
+    """
+    # both are covered by the composite indexes below
+    donation = models.ForeignKey(Donation, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                 related_name='status_changes')
+    changed_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, db_index=False,
+                                   related_name='donation_status_changes')
+    is_taken = models.BooleanField()
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['donation', '-changed_at'], name='status_change_by_donation'),
+            models.Index(fields=['changed_by', '-changed_at'], name='status_change_by_user'),
+            models.Index(fields=['changed_at'], name='status_change_changed_at'),
+        ]
+
+    def __str__(self):
+        state = 'taken' if self.is_taken else 'not taken'
+        return f"Donation {self.donation_id} marked {state} by {self.changed_by_id} at {self.changed_at:%Y-%m-%d %H:%M}"
+
+
+class DataVersion(models.Model):
+    """Monotonic counter bumped whenever the data behind a group of pages changes."""
+    CATALOG = 'catalog'
+    DONATIONS = 'donations'
+
+    key = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class ContactMessage(models.Model):
+    """Contact form submission, mailed to superusers in digests by the send_contact_digest command."""
+    name = models.CharField(max_length=255)
+    surname = models.CharField(max_length=255)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # set by the digest run mailing the message, expires after CONTACT_DIGEST_CLAIM_TIMEOUT
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.name} {self.surname} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class DonationRollup(models.Model):
+    """
+    Bags and donations per pick-up day and institution, kept up to date by signals (see rollups.py).
+    Rows with category=None hold the totals per city, a donation with several categories counts once
+    there and once in the row of each of its categories, which are not split by city (city='').
+    """
+    day = models.DateField()
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.CASCADE)
+    city = models.CharField(max_length=255, blank=True)
+    bags = models.BigIntegerField(default=0)
+    donations = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'institution', 'category'],
+                                    condition=models.Q(category__isnull=False), name='unique_category_rollup'),
+            # NULLs never collide in a unique index, the totals rows need their own one
+            models.UniqueConstraint(fields=['day', 'institution', 'city'],
+                                    condition=models.Q(category__isnull=True), name='unique_total_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.institution_id}/{self.category_id}/{self.city}: {self.bags} bags"
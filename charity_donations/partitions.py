@@ -0,0 +1,194 @@
+"""
+Monthly range partitioning of the donation table by pick_up_date (PostgreSQL only).
+
+PostgreSQL requires the partition key in every unique constraint, so the partitioned table
+has PRIMARY KEY (id, pick_up_date) and ids come from a sequence. Foreign keys pointing at a
+donation id alone (the categories M2M table) cannot exist and are dropped by convert_table(),
+so a partition is only detached once it is empty: its collected donations are archived first
+(see the partition_donations command) and the archive takes their category links along.
+"""
+import re
+from datetime import date
+
+TABLE = 'charity_donations_donation'
+M2M_TABLE = 'charity_donations_donation_categories'
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+# the queries the partition layout is meant for, used by explain_hot_queries()
+HOT_QUERIES = {
+    'user history': f'SELECT * FROM {TABLE} WHERE user_id = %s ORDER BY pick_up_date DESC',
+    'pending pick-ups': f'SELECT * FROM {TABLE} WHERE NOT is_taken AND pick_up_date >= %s',
+    'landing totals': f'SELECT SUM(quantity), COUNT(DISTINCT institution_id) FROM {TABLE}',
+}
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def partition_month(name):
+    """Return the first day of the month a partition covers, or None for other tables."""
+    match = PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def months_between(first, last):
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def create_partition_sql(month):
+    return (f'CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE} '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')")
+
+
+def is_partitioned(cursor):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+    return cursor.fetchone() is not None
+
+
+def existing_partitions(cursor):
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = %s',
+        [TABLE],
+    )
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def ensure_partitions(cursor, first_month, last_month):
+    """
+    Create the missing monthly partitions from first_month to last_month, return their names.
+
+    PostgreSQL refuses a new partition while the DEFAULT partition holds rows of its range, e.g.
+    a donation scheduled past the last month. The default partition is then detached while the
+    partitions are created, its rows of their ranges moved into them, and attached again.
+    """
+    existing = set(existing_partitions(cursor))
+    missing = [month for month in months_between(first_month, last_month) if partition_name(month) not in existing]
+    if not missing:
+        return []
+
+    # rows of the default partition within this range can only belong to the missing months
+    in_range = 'pick_up_date >= %s AND pick_up_date < %s'
+    bounds = [missing[0], add_months(missing[-1], 1)]
+    move_rows = False
+    if DEFAULT_PARTITION in existing:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})', bounds)
+        move_rows = cursor.fetchone()[0]
+
+    if move_rows:
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+    for month in missing:
+        cursor.execute(create_partition_sql(month))
+    if move_rows:
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}', bounds)
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}', bounds)
+        cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    return [partition_name(month) for month in missing]
+
+
+def detach_partitions(cursor, before_month):
+    """
+    Detach (not drop) the empty monthly partitions that end before before_month.
+
+    Returns (detached, kept); kept are the partitions still holding donations, e.g. ones never
+    marked as collected. They stay attached, so those donations stay in the profile history and
+    the counters and keep their category links, which have no foreign key to check them.
+    """
+    detached, kept = [], []
+    for name in existing_partitions(cursor):
+        month = partition_month(name)
+        if month is None or add_months(month, 1) > before_month:
+            continue
+        # no donation can be written into the partition between the check and the detach
+        cursor.execute(f'LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name})')
+        if cursor.fetchone()[0]:
+            kept.append(name)
+            continue
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        detached.append(name)
+    return detached, kept
+
+
+def convert_table(cursor, today, months_ahead):
+    """
+    Replace the plain donation table with a partitioned one holding the same rows.
+    Must run inside a transaction; the old table is locked for the duration of the copy.
+    """
+    old_table = f'{TABLE}_unpartitioned'
+    sequence = f'{TABLE}_id_seq'
+
+    # deferred foreign key checks still pending in this transaction would block ALTER TABLE
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+
+    # foreign keys to donation(id) alone are impossible once the key includes pick_up_date
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE contype = 'f' "
+        'AND conrelid = %s::regclass AND confrelid = %s::regclass',
+        [M2M_TABLE, TABLE],
+    )
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {M2M_TABLE} DROP CONSTRAINT {constraint}')
+
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old_table}')
+    cursor.execute(
+        f'CREATE TABLE {TABLE} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        'PARTITION BY RANGE (pick_up_date)'
+    )
+    cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {sequence}_partitioned OWNED BY {TABLE}.id')
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}_partitioned')")
+    cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, pick_up_date)')
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD FOREIGN KEY (institution_id) '
+        'REFERENCES charity_donations_institution (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD FOREIGN KEY (user_id) '
+        'REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(f'CREATE INDEX {TABLE}_user_date ON {TABLE} (user_id, pick_up_date)')
+    cursor.execute(f'CREATE INDEX {TABLE}_institution ON {TABLE} (institution_id)')
+    cursor.execute(f'CREATE INDEX {TABLE}_pending ON {TABLE} (pick_up_date) WHERE NOT is_taken')
+
+    cursor.execute(f'SELECT MIN(pick_up_date) FROM {old_table}')
+    first_day = cursor.fetchone()[0] or today
+    ensure_partitions(cursor, month_start(first_day), add_months(month_start(today), months_ahead))
+    # rows outside every monthly range (dates far in the future) land here instead of failing,
+    # ensure_partitions() moves them out when their month gets a partition
+    cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old_table}')
+    cursor.execute(f"SELECT setval('{sequence}_partitioned', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+    cursor.execute(f'DROP TABLE {old_table}')
+
+
+def explain_hot_queries(cursor, user_id, today):
+    """Return {query name: number of partitions the plan touches} for HOT_QUERIES."""
+    params = {
+        'user history': [user_id],
+        'pending pick-ups': [today],
+        'landing totals': [],
+    }
+    scanned = {}
+    for name, sql in HOT_QUERIES.items():
+        cursor.execute(f'EXPLAIN (FORMAT TEXT) {sql}', params[name])
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+        scanned[name] = len(set(re.findall(rf'\b({TABLE}_(?:p\d{{4}}_\d{{2}}|default))\b', plan)))
+    return scanned
@@ -0,0 +1,32 @@
+"""
+Preload hints for the critical static assets of a page.
+
+Templates name their critical assets with the {% preload %} tag, PreloadLinkMiddleware sends them
+in a Link header and remembers them per view, and under ASGI EarlyHintsMiddleware replays the
+remembered links as 103 Early Hints before the view runs its queries.
+"""
+from django.templatetags.static import static
+from django.urls import Resolver404, resolve
+
+# view name -> links of its last page, per process
+learned_links = {}
+
+
+def add_preload(request, path, as_):
+    links = request.__dict__.setdefault('_preload_links', [])
+    link = f'<{static(path)}>; rel=preload; as={as_}'
+    if link not in links:
+        links.append(link)
+
+
+def remember_links(request, links):
+    if request.resolver_match is not None:
+        learned_links[request.resolver_match.view_name] = links
+
+
+def links_for_path(path):
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    return learned_links.get(match.view_name)
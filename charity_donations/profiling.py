@@ -0,0 +1,104 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+REPORT_NAME_RE = re.compile(r'^\d{8}-\d{6}-\d{6}-[0-9a-f]{8}\.(prof|html)$')
+
+
+class SQLTimeline:
+    """Records every query of the profiled request with its offset and duration."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = []
+
+    def wrapper(self, alias):
+        def execute_wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                finished = time.perf_counter()
+                self.queries.append({
+                    'alias': alias,
+                    'offset_ms': (started - self.start) * 1000,
+                    'duration_ms': (finished - started) * 1000,
+                    'sql': sql,
+                })
+
+        return execute_wrapper
+
+
+def profile_request(request, get_response):
+    """Run get_response under cProfile and the SQL timeline, store the report, return (response, name)."""
+    timeline = SQLTimeline()
+    profiler = cProfile.Profile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timeline.wrapper(connection.alias)))
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    duration_ms = (time.perf_counter() - timeline.start) * 1000
+
+    name = save_report(request, profiler, timeline, duration_ms)
+    return response, name
+
+
+def save_report(request, profiler, timeline, duration_ms):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:8]}"
+
+    profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+
+    stats_output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_output)
+    stats.sort_stats('cumulative').print_stats(40)
+
+    html = render_to_string('profiling_report.html', {
+        'name': name,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.user,
+        'duration_ms': duration_ms,
+        'queries': timeline.queries,
+        'sql_time_ms': sum(query['duration_ms'] for query in timeline.queries),
+        'stats': stats_output.getvalue(),
+    })
+    with open(os.path.join(directory, f'{name}.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+
+    prune_reports(directory, settings.PROFILING_MAX_REPORTS)
+    return name
+
+
+def report_path(name):
+    """Return the path of a stored report, or None for unknown or malformed names."""
+    if not REPORT_NAME_RE.match(name):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, name)
+    return path if os.path.exists(path) else None
+
+
+def prune_reports(directory, max_reports):
+    """Keep only the newest max_reports reports (ring buffer on disk)."""
+    names = sorted({filename.rsplit('.', 1)[0] for filename in os.listdir(directory)
+                    if REPORT_NAME_RE.match(filename)})
+    for name in names[:-max_reports] if max_reports else names:
+        for extension in ('prof', 'html'):
+            path = os.path.join(directory, f'{name}.{extension}')
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,79 @@
+"""
+Incremental maintenance of DonationRollup.
+
+Every donation adds its bags to the totals row (category=None) of its day, institution and city
+and to the row of each of its categories for the day and institution. The signal handlers in
+signals.py call the functions below on each save, delete and categories change. QuerySet.update()
+and raw SQL bypass the signals, run the rebuild_donation_rollups command after such bulk changes.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from charity_donations.models import Donation, DonationRollup
+
+STATE_FIELDS = ('pick_up_date', 'institution_id', 'city', 'quantity')
+
+
+def donation_state(donation):
+    """(day, institution_id, city, bags) of a donation instance, None if a field is deferred."""
+    values = donation.__dict__
+    if any(name not in values for name in STATE_FIELDS):
+        return None
+    # views create donations from POST data, so the values may still be strings
+    day = Donation._meta.get_field('pick_up_date').to_python(values['pick_up_date'])
+    return day, values['institution_id'], values['city'], int(values['quantity'])
+
+
+def stored_state(donation):
+    row = Donation.objects.filter(pk=donation.pk).values_list(*STATE_FIELDS).first()
+    return None if row is None else (row[0], row[1], row[2], int(row[3]))
+
+
+def add_to_rollup(day, institution_id, category_id, city, bags, donations):
+    rows = DonationRollup.objects.filter(day=day, institution_id=institution_id, category_id=category_id, city=city)
+    if rows.update(bags=F('bags') + bags, donations=F('donations') + donations) or donations < 0:
+        # a missing row is never created with negative numbers, the rebuild command fixes the totals
+        return
+    try:
+        with transaction.atomic():
+            DonationRollup.objects.create(day=day, institution_id=institution_id, category_id=category_id,
+                                          city=city, bags=bags, donations=donations)
+    except IntegrityError:
+        # a concurrent writer created the row in between
+        rows.update(bags=F('bags') + bags, donations=F('donations') + donations)
+
+
+def apply_donation(state, category_ids, sign):
+    """Add (sign=1) or subtract (sign=-1) one donation to its totals row and its category rows."""
+    day, institution_id, city, bags = state
+    add_to_rollup(day, institution_id, None, city, sign * bags, sign)
+    for category_id in category_ids:
+        add_to_rollup(day, institution_id, category_id, '', sign * bags, sign)
+
+
+def apply_category_links(links, sign):
+    """Add or subtract donation-category links given as (day, institution_id, bags, category_id)."""
+    deltas = defaultdict(lambda: [0, 0])
+    for day, institution_id, bags, category_id in links:
+        delta = deltas[day, institution_id, category_id]
+        delta[0] += sign * bags
+        delta[1] += sign
+    for (day, institution_id, category_id), (bags, donations) in deltas.items():
+        add_to_rollup(day, institution_id, category_id, '', bags, donations)
+
+
+def category_links(instance, reverse, pk_set):
+    """The donation-category links an m2m_changed signal is about, as expected by apply_category_links."""
+    links = Donation.categories.through.objects.all()
+    if reverse:
+        links = links.filter(category_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(donation_id__in=pk_set)
+    else:
+        links = links.filter(donation_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(category_id__in=pk_set)
+    return links.values_list('donation__pick_up_date', 'donation__institution_id', 'donation__quantity',
+                             'category_id')
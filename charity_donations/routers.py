@@ -0,0 +1,99 @@
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+# {'alias': ...} while a view decorated with read_from_replica runs, the replica is picked
+# on the first read and kept for the rest of the view so all its reads see the same snapshot
+_replica_reads = ContextVar('replica_reads', default=None)
+# per-request state set up by ReplicaPinningMiddleware: {'pinned': bool, 'wrote': bool}
+request_state = ContextVar('replica_request_state', default=None)
+
+_round_robin = itertools.count()
+_latency_lock = threading.Lock()
+# exponentially weighted moving average of query latency per replica alias, in ms
+_latencies = {}
+LATENCY_WEIGHT = 0.2
+
+
+def read_from_replica(view):
+    """Let the queries of a read-only view (or view method) go to a replica."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _replica_reads.set({'alias': None})
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+
+    return wrapper
+
+
+def record_latency(alias, duration_ms):
+    with _latency_lock:
+        previous = _latencies.get(alias)
+        if previous is None:
+            _latencies[alias] = duration_ms
+        else:
+            _latencies[alias] = previous + LATENCY_WEIGHT * (duration_ms - previous)
+
+
+def track_replica_latency(sender, connection, **kwargs):
+    if connection.alias not in settings.DATABASE_REPLICAS:
+        return
+
+    def latency_wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            record_latency(connection.alias, (time.perf_counter() - start) * 1000)
+
+    if not any(getattr(wrapper, 'tracks_latency', False) for wrapper in connection.execute_wrappers):
+        latency_wrapper.tracks_latency = True
+        # front of the list, see install_slow_query_wrapper
+        connection.execute_wrappers.insert(0, latency_wrapper)
+
+
+def choose_replica(replicas):
+    if settings.DATABASE_REPLICA_SELECTION == 'least_latency':
+        # replicas without measurements yet are tried first
+        return min(replicas, key=lambda alias: _latencies.get(alias, 0))
+    return replicas[next(_round_robin) % len(replicas)]
+
+
+class ReplicaRouter:
+    """
+    Sends reads from views decorated with read_from_replica to DATABASE_REPLICAS, everything
+    else to the primary. A visitor who wrote recently is pinned to the primary
+    (see middleware.ReplicaPinningMiddleware) so they always read their own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        replica_reads = _replica_reads.get()
+        if not replicas or replica_reads is None:
+            return None
+        state = request_state.get()
+        if state is not None and state['pinned']:
+            return None
+        if replica_reads['alias'] is None:
+            replica_reads['alias'] = choose_replica(replicas)
+        return replica_reads['alias']
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
@@ -0,0 +1,52 @@
+"""
+The service worker (templates/sw.js), served from the site root by ServiceWorkerView.
+
+It precaches the stylesheet, app.js, the footer icons and every image the stylesheet uses, all
+content-hashed by the static storage, and serves the donation form shell stale-while-revalidate. Its caches are
+named after a version derived from the static manifest, so a deploy that changes static files
+installs a new worker that drops the old caches.
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.urls import reverse
+
+from charity_donations.critical_css import STYLESHEET, URL_RE, load_stylesheet, stylesheet_asset
+
+# what base.html loads besides the stylesheet and its images
+PAGE_ASSETS = ('js/app.js', 'images/icon-facebook.svg', 'images/icon-instagram.svg')
+
+
+def precached_assets():
+    images = {stylesheet_asset(url) for _, url in URL_RE.findall(load_stylesheet())}
+    return [STYLESHEET, *PAGE_ASSETS, *sorted(path for path in images if path is not None)]
+
+
+def build():
+    """(version, script) of the service worker."""
+    precache = [static(path) for path in precached_assets()]
+    # manifest_hash changes with every collectstatic that changes a file; without a manifest
+    # (DEBUG, tests) the static URLs are all there is
+    manifest_hash = getattr(staticfiles_storage, 'manifest_hash', '')
+    version = hashlib.sha256('\n'.join([manifest_hash, *precache]).encode()).hexdigest()[:12]
+    config = {
+        'version': version,
+        'staticUrl': static(''),
+        'precache': precache,
+        'shells': [reverse('AddDonation')],
+        # logging in or out changes the navbar of the cached shells
+        'sessionChanges': [reverse('Login'), reverse('Logout')],
+    }
+    return version, render_to_string('sw.js', {'config': json.dumps(config, indent=4)})
+
+
+cached_build = functools.cache(build)
+
+
+def service_worker():
+    return build() if settings.DEBUG else cached_build()
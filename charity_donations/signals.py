@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User, update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from charity_donations.contact import invalidate_contact_recipients
+from charity_donations import archive, counters, rollups, user_cache
+from charity_donations.models import Category, DataVersion, Donation, Institution
+from charity_donations.routers import track_replica_latency
+from charity_donations.slow_queries import install_slow_query_wrapper
+from charity_donations.versioning import bump_version
+
+M2M_CHANGES = ('post_add', 'post_remove', 'post_clear')
+
+
+@receiver([post_save, post_delete], sender=Institution)
+@receiver([post_save, post_delete], sender=Category)
+def bump_catalog_version(sender, **kwargs):
+    bump_version(DataVersion.CATALOG)
+
+
+@receiver(m2m_changed, sender=Institution.categories.through)
+def bump_catalog_version_on_categories_change(sender, action, **kwargs):
+    if action in M2M_CHANGES:
+        bump_version(DataVersion.CATALOG)
+
+
+@receiver([post_save, post_delete], sender=Donation)
+def bump_donations_version(sender, **kwargs):
+    bump_version(DataVersion.DONATIONS)
+
+
+@receiver(m2m_changed, sender=Donation.categories.through)
+def bump_donations_version_on_categories_change(sender, action, **kwargs):
+    if action in M2M_CHANGES:
+        bump_version(DataVersion.DONATIONS)
+
+
+@receiver(post_init, sender=Donation)
+def remember_rollup_state(sender, instance, **kwargs):
+    instance._rollup_state = None if instance.pk is None else rollups.donation_state(instance)
+
+
+@receiver(pre_save, sender=Donation)
+def load_rollup_state(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding and instance._rollup_state is None:
+        # loaded with deferred fields, the old values are needed to move the bags
+        instance._rollup_state = rollups.stored_state(instance)
+
+
+@receiver(post_save, sender=Donation)
+def update_donation_aggregates_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_state, new_state = instance._rollup_state, rollups.donation_state(instance)
+    if created or old_state is None:
+        # categories are added afterwards and counted by update_rollups_on_categories_change
+        rollups.apply_donation(new_state, (), 1)
+        counters.add_donation(new_state)
+    elif old_state != new_state:
+        category_ids = list(instance.categories.values_list('id', flat=True))
+        rollups.apply_donation(old_state, category_ids, -1)
+        rollups.apply_donation(new_state, category_ids, 1)
+        counters.move_donation(old_state, new_state, instance.pk)
+    instance._rollup_state = new_state
+
+
+@receiver(pre_delete, sender=Donation)
+def update_donation_aggregates_on_delete(sender, instance, **kwargs):
+    if archive.archiving.get():
+        # an archived donation keeps counting
+        return
+    state = instance._rollup_state or rollups.stored_state(instance)
+    if state is not None:
+        rollups.apply_donation(state, list(instance.categories.values_list('id', flat=True)), -1)
+        counters.remove_donation(state, instance.pk)
+
+
+@receiver(m2m_changed, sender=Donation.categories.through)
+def update_rollups_on_categories_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # links are read while they exist: after adding, before removing
+    if action == 'post_add' and pk_set:
+        rollups.apply_category_links(rollups.category_links(instance, reverse, pk_set), 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        rollups.apply_category_links(rollups.category_links(instance, reverse, pk_set), -1)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_contact_recipients_on_user_change(sender, **kwargs):
+    invalidate_contact_recipients()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate_user(instance.pk)
+
+
+# django.contrib.auth writes last_login on every login, the app's version throttles it
+user_logged_in.disconnect(update_last_login, dispatch_uid='update_last_login')
+user_logged_in.connect(user_cache.update_last_login, dispatch_uid='throttled_update_last_login')
+
+
+connection_created.connect(install_slow_query_wrapper, dispatch_uid='install_slow_query_wrapper')
+connection_created.connect(track_replica_latency, dispatch_uid='track_replica_latency')
@@ -0,0 +1,109 @@
+import atexit
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.template.base import Node
+from django.utils import timezone
+
+from charity_donations.budgets import fingerprint
+
+IGNORED_PATHS = ('site-packages', 'dist-packages', __file__)
+
+
+def find_call_site():
+    """Return the first app-level frame and the template node (name:line) that issued a query."""
+    app_frame = template = None
+    frame = sys._getframe(2)
+    base_dir = str(settings.BASE_DIR)
+    while frame is not None and (app_frame is None or template is None):
+        code = frame.f_code
+        if template is None:
+            node = frame.f_locals.get('self')
+            # type() rather than isinstance(): it must not evaluate lazy objects such as request.user
+            if issubclass(type(node), Node) and getattr(node, 'token', None) and getattr(node, 'origin', None):
+                template = f'{node.origin.template_name}:{node.token.lineno}'
+        if app_frame is None and code.co_filename.startswith(base_dir) \
+                and not any(path in code.co_filename for path in IGNORED_PATHS):
+            filename = os.path.relpath(code.co_filename, base_dir)
+            app_frame = f'{filename}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return app_frame, template
+
+
+class SlowQueryLog:
+    """
+    Aggregates slow queries by fingerprint in memory and appends them to a JSONL file
+    every SLOW_QUERY_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.last_flush = time.monotonic()
+
+    def record(self, sql, duration_ms, rows):
+        app_frame, template = find_call_site()
+        key = fingerprint(sql)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = {
+                    'fingerprint': key,
+                    'sample_sql': sql,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'rows': 0,
+                    'call_sites': {},
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['rows'] += max(rows, 0)
+            call_site = ' | '.join(site for site in (app_frame, template) if site) or 'unknown'
+            entry['call_sites'][call_site] = entry['call_sites'].get(call_site, 0) + 1
+
+        if time.monotonic() - self.last_flush >= settings.SLOW_QUERY_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            entries, self.entries = self.entries, {}
+            self.last_flush = time.monotonic()
+        if not entries or not settings.SLOW_QUERY_LOG_FILE:
+            return
+
+        flushed_at = timezone.now().isoformat()
+        with open(settings.SLOW_QUERY_LOG_FILE, 'a', encoding='utf-8') as f:
+            for entry in entries.values():
+                entry['total_ms'] = round(entry['total_ms'], 3)
+                entry['max_ms'] = round(entry['max_ms'], 3)
+                f.write(json.dumps({'flushed_at': flushed_at, **entry}) + '\n')
+
+
+slow_query_log = SlowQueryLog()
+atexit.register(slow_query_log.flush)
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    if not settings.SLOW_QUERY_LOG_FILE:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - start) * 1000
+    if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS and random.random() < settings.SLOW_QUERY_SAMPLE_RATE:
+        slow_query_log.record(sql, duration_ms, context['cursor'].rowcount)
+    return result
+
+
+def install_slow_query_wrapper(sender, connection, **kwargs):
+    # insert at the front: connection.execute_wrapper() blocks that are open while the
+    # connection gets created pop their own wrapper from the end of the list
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
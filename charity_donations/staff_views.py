@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.db import models
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.views import View
+
+from charity_donations.budgets import query_budget
+from charity_donations.catalog import get_catalog
+from charity_donations.models import DonationRollup
+from charity_donations.profiling import report_path
+from charity_donations.routers import read_from_replica
+
+# Staff-only pages, loaded on first use (see urls.lazy_view)
+
+
+class ProfilingReportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, report):
+        path = report_path(report)
+        if path is None:
+            raise Http404("Report not found")
+        if report.endswith('.html'):
+            return FileResponse(open(path, 'rb'), content_type='text/html; charset=utf-8')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=report)
+
+
+def stats_chart(rows, key, labels):
+    """Rows of a rollup GROUP BY with bar widths relative to the largest value."""
+    rows = list(rows)
+    largest = max((row['bags'] for row in rows), default=0) or 1
+    return [{
+        'label': labels.get(row[key], row[key]) if labels is not None else row[key],
+        'bags': row['bags'],
+        'donations': row['donations'],
+        'percent': round(100 * row['bags'] / largest, 1),
+    } for row in rows]
+
+
+class DonationStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    DEFAULT_DAYS = 30
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    @staticmethod
+    def parse_date(value, default):
+        try:
+            return date.fromisoformat(value) if value else default
+        except ValueError:
+            return default
+
+    @read_from_replica
+    @query_budget(max_queries=10, max_duration_ms=500)
+    def get(self, request):
+        end = self.parse_date(request.GET.get('to'), date.today())
+        start = self.parse_date(request.GET.get('from'), end - timedelta(days=self.DEFAULT_DAYS - 1))
+
+        # only the rollups are read, names come from the catalog snapshot
+        catalog = get_catalog()
+        rollups = DonationRollup.objects.filter(day__range=(start, end))
+        totals = rollups.filter(category__isnull=True)
+        sums = {'bags': models.Sum('bags'), 'donations': models.Sum('donations')}
+
+        context = {
+            'start': start,
+            'end': end,
+            'summary': totals.aggregate(**sums),
+            'charts': [
+                ('Worki dziennie', stats_chart(totals.values('day').annotate(**sums).order_by('day'), 'day', None)),
+                ('Organizacje', stats_chart(
+                    totals.values('institution').annotate(**sums).order_by('-bags', 'institution'), 'institution',
+                    {institution.pk: institution.name for institution in catalog.institutions})),
+                ('Kategorie', stats_chart(
+                    rollups.filter(category__isnull=False).values('category').annotate(**sums)
+                    .order_by('-bags', 'category'), 'category',
+                    {category.pk: category.name for category in catalog.categories})),
+                ('Miasta', stats_chart(
+                    totals.values('city').annotate(**sums).order_by('-bags', 'city'), 'city', None)),
+            ],
+        }
+        return render(request, 'donation_stats.html', context)
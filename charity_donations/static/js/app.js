@@ -1,4 +1,59 @@
 document.addEventListener("DOMContentLoaded", function () {
+    /**
+     * Service worker - cached static files and donation form shell
+     */
+    if ("serviceWorker" in navigator && document.body.dataset.serviceWorker) {
+        // Registered after the page has loaded, its precaching must not compete with the page
+        window.addEventListener("load", () => {
+            navigator.serviceWorker.register(document.body.dataset.serviceWorker)
+                .catch(error => console.error('Error registering the service worker:', error));
+        });
+    }
+
+    /**
+     * Lazy CSRF token for forms on cached pages (data-csrf-url): shared caches, the service worker
+     */
+    let csrfTokenRequest = null;
+
+    function fetchCsrfToken(url) {
+        if (csrfTokenRequest === null) {
+            csrfTokenRequest = fetch(url, {credentials: "same-origin"})
+                .then(response => response.json())
+                .then(data => data.token)
+                .catch(error => {
+                    csrfTokenRequest = null;
+                    throw error;
+                });
+        }
+        return csrfTokenRequest;
+    }
+
+    document.querySelectorAll("form[data-csrf-url]").forEach(form => {
+        const insertToken = () => fetchCsrfToken(form.dataset.csrfUrl).then(token => {
+            let input = form.querySelector('[name="csrfmiddlewaretoken"]');
+            if (input === null) {
+                input = document.createElement("input");
+                input.type = "hidden";
+                input.name = "csrfmiddlewaretoken";
+                form.appendChild(input);
+            }
+            input.value = token;
+        });
+
+        // Start fetching as soon as the visitor begins to fill the form
+        form.addEventListener("focusin", () => insertToken().catch(() => null), {once: true});
+
+        form.addEventListener("submit", e => {
+            if (form.querySelector('[name="csrfmiddlewaretoken"]') !== null) {
+                return;
+            }
+            e.preventDefault();
+            insertToken()
+                .then(() => form.submit())
+                .catch(error => console.error('Error fetching CSRF token:', error));
+        });
+    });
+
     /**
      * HomePage - Help section
      */
@@ -8,36 +63,53 @@ document.addEventListener("DOMContentLoaded", function () {
             this.$buttonsContainer = $el.querySelector(".help--buttons");
             this.$slidesContainers = $el.querySelectorAll(".help--slides");
             this.currentSlide = this.$buttonsContainer.querySelector(".active").parentElement.dataset.id;
+            // Fetched pages per list type, a Map from page number to {promise, controller, settled}
+            // kept in least recently used order
+            this.pages = {};
+            this.pageCacheSize = 10;
+            // The page each list should end up showing, answers of earlier clicks are dropped
+            this.wantedPages = {};
             this.init();
         }
 
         init() {
+            this.$el.querySelectorAll(".pagination[data-list]").forEach($pagination => {
+                const listType = $pagination.dataset.list;
+                // The page rendered with the landing page, going back to it needs no request
+                const content = Promise.resolve(this.listContent(this.$el, listType));
+                this.pages[listType] = new Map([[this.currentPage(listType), {promise: content, controller: null, settled: true}]]);
+                this.prefetchNext(listType);
+            });
             this.events();
         }
 
         events() {
-            /**
-             * Slide buttons
-             */
-            this.$buttonsContainer.addEventListener("click", e => {
-                if (e.target.classList.contains("btn")) {
-                    this.changeSlide(e);
+            // Bound once on the section: the pagination links are replaced with every page
+            this.$el.addEventListener("click", e => {
+                const $btn = e.target.closest(".btn");
+                if ($btn === null) {
+                    return;
+                }
+                if (this.$buttonsContainer.contains($btn)) {
+                    this.changeSlide(e, $btn);
+                } else if ($btn.matches(".help--slides-pagination a[data-page]")) {
+                    this.changePage(e, $btn);
                 }
             });
 
-            /**
-             * Pagination buttons
-             */
-            this.$el.addEventListener("click", e => {
-                if (e.target.classList.contains("btn") && e.target.parentElement.parentElement.classList.contains("help--slides-pagination")) {
-                    this.changePage(e);
+            // A pointer over a link or keyboard focus on it is a good hint of the next click
+            const prefetchLink = e => {
+                const $link = e.target.closest(".help--slides-pagination a[data-page]");
+                if ($link !== null) {
+                    this.load($link.closest(".pagination").dataset.list, $link.dataset.page).catch(() => null);
                 }
-            });
+            };
+            this.$el.addEventListener("mouseover", prefetchLink);
+            this.$el.addEventListener("focusin", prefetchLink);
         }
 
-        changeSlide(e) {
+        changeSlide(e, $btn) {
             e.preventDefault();
-            const $btn = e.target;
 
             // Buttons Active class change
             [...this.$buttonsContainer.children].forEach(btn => btn.firstElementChild.classList.remove("active"));
@@ -56,32 +128,104 @@ document.addEventListener("DOMContentLoaded", function () {
             });
         }
 
-        changePage(e) {
+        changePage(e, $btn) {
             e.preventDefault();
-            const $btn = e.target;
-            const page = $btn.dataset.page;
             const listType = $btn.closest(".pagination").dataset.list;
+            const page = $btn.dataset.page;
+            this.wantedPages[listType] = page;
 
-            fetch(`?page_${listType}=${page}`)
-                .then(response => response.text())
-                .then(html => {
-                    const parser = new DOMParser();
-                    const doc = parser.parseFromString(html, 'text/html');
-
-                    // Update the corresponding list
-                    const newContent = doc.querySelector(`.help--slides[data-id="${this.currentSlide}"] .help--slides-items`);
-                    const newPagination = doc.querySelector(`.pagination[data-list="${listType}"] .help--slides-pagination`);
+            // Requests for other pages of this list are stale now
+            this.pages[listType].forEach((entry, number) => {
+                if (number !== page && !entry.settled) {
+                    entry.controller.abort();
+                    this.pages[listType].delete(number);
+                }
+            });
 
-                    const currentContent = this.$el.querySelector(`.help--slides[data-id="${this.currentSlide}"] .help--slides-items`);
-                    const currentPagination = this.$el.querySelector(`.pagination[data-list="${listType}"] .help--slides-pagination`);
+            this.load(listType, page)
+                .then(content => {
+                    if (this.wantedPages[listType] !== page) {
+                        return;
+                    }
+                    this.showPage(listType, content);
+                    this.prefetchNext(listType);
+                })
+                .catch(error => {
+                    if (error.name !== "AbortError") {
+                        console.error('Error loading new page:', error);
+                    }
+                });
+        }
 
-                    currentContent.innerHTML = newContent.innerHTML;
-                    currentPagination.innerHTML = newPagination.innerHTML;
+        load(listType, page) {
+            const pages = this.pages[listType];
+            if (pages.has(page)) {
+                const entry = pages.get(page);
+                pages.delete(page);
+                pages.set(page, entry);
+                return entry.promise;
+            }
 
-                    // Reattach events after replacing content
-                    this.events();
+            const entry = {controller: new AbortController(), settled: false};
+            // Only the list, not the whole landing page
+            entry.promise = fetch(`?list=${listType}&page_${listType}=${page}`, {credentials: "same-origin", signal: entry.controller.signal})
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP ${response.status}`);
+                    }
+                    return response.text();
+                })
+                .then(html => this.listContent(new DOMParser().parseFromString(html, "text/html"), listType));
+            entry.promise
+                .then(() => {
+                    entry.settled = true;
                 })
-                .catch(error => console.error('Error loading new page:', error));
+                .catch(() => {
+                    // Failed and aborted pages are fetched again next time
+                    if (pages.get(page) === entry) {
+                        pages.delete(page);
+                    }
+                });
+
+            pages.set(page, entry);
+            while (pages.size > this.pageCacheSize) {
+                pages.delete(pages.keys().next().value);
+            }
+            return entry.promise;
+        }
+
+        listContent($root, listType) {
+            const $pagination = $root.querySelector(`.pagination[data-list="${listType}"]`);
+            if ($pagination === null) {
+                throw new Error(`No ${listType} list in the page`);
+            }
+            return {
+                items: $pagination.parentElement.querySelector(".help--slides-items").innerHTML,
+                pagination: $pagination.querySelector(".help--slides-pagination").innerHTML,
+            };
+        }
+
+        showPage(listType, content) {
+            const $pagination = this.$el.querySelector(`.pagination[data-list="${listType}"]`);
+            $pagination.parentElement.querySelector(".help--slides-items").innerHTML = content.items;
+            $pagination.querySelector(".help--slides-pagination").innerHTML = content.pagination;
+        }
+
+        currentPage(listType) {
+            return this.$el.querySelector(`.pagination[data-list="${listType}"] .current`).dataset.number;
+        }
+
+        prefetchNext(listType) {
+            // Leave metered connections alone
+            if (navigator.connection && navigator.connection.saveData) {
+                return;
+            }
+            const next = String(Number(this.currentPage(listType)) + 1);
+            if (this.$el.querySelector(`.pagination[data-list="${listType}"] a[data-page="${next}"]`) === null) {
+                return;
+            }
+            const whenIdle = window.requestIdleCallback || (callback => setTimeout(callback, 200));
+            whenIdle(() => this.load(listType, next).catch(() => null));
         }
     }
 
@@ -208,6 +352,12 @@ document.addEventListener("DOMContentLoaded", function () {
 
             this.categories = Array.from(document.querySelectorAll('[name="categories"]:checked')).map(el => el.value);
 
+            // Step 3 is loaded from the server, page by page, for the selected categories
+            this.$organizations = form.querySelector(".organizations");
+            this.$moreOrganizations = form.querySelector(".organizations--more");
+            this.organizationsQuery = null;
+            this.organizationsRequest = null;
+
             this.feedbackMessages = {
                 1: document.getElementById('feedback-message-step-1'),
                 2: document.getElementById('feedback-message-step-2'),
@@ -248,16 +398,21 @@ document.addEventListener("DOMContentLoaded", function () {
             document.querySelectorAll('[name="categories"]').forEach(el => {
                 el.addEventListener("change", () => {
                     this.categories = Array.from(document.querySelectorAll('[name="categories"]:checked')).map(el => el.value);
-                    this.filterOrganizations();
                     this.populateSummary();
                     this.validateStep();
                 });
             });
 
-            document.querySelectorAll('[name="organization"]').forEach(el => {
-                el.addEventListener("change", () => {
+            // The radios are replaced on every load, so listen on their container
+            this.$organizations.addEventListener("change", e => {
+                if (e.target.name === "organization") {
                     this.validateStep();
-                });
+                }
+            });
+
+            this.$moreOrganizations.addEventListener("click", e => {
+                e.preventDefault();
+                this.loadOrganizations(this.$moreOrganizations.dataset.page);
             });
 
             const bagsInput = document.querySelector('[name="bags"]');
@@ -286,24 +441,86 @@ document.addEventListener("DOMContentLoaded", function () {
             });
 
             if (this.currentStep === 3) {
-                this.filterOrganizations();
+                this.loadOrganizations();
             }
 
             this.populateSummary();
         }
 
-        filterOrganizations() {
-            const organizations = document.querySelectorAll('[name="organization"]');
+        loadOrganizations(page) {
+            const params = new URLSearchParams();
+            this.categories.forEach(category => params.append("categories", category));
+            const query = params.toString();
 
-            organizations.forEach(org => {
-                const orgCategories = JSON.parse(org.dataset.categories);
-
-                if (this.categories.every(cat => orgCategories.includes(parseInt(cat)))) {
-                    org.closest('.form-group--checkbox').style.display = 'block';
-                } else {
-                    org.closest('.form-group--checkbox').style.display = 'none';
+            if (page === undefined) {
+                // Coming back to step 3 with the same categories keeps the loaded list and the choice
+                if (query === this.organizationsQuery) {
+                    return;
                 }
-            });
+                this.organizationsQuery = query;
+                this.$organizations.innerHTML = "";
+                this.$moreOrganizations.style.display = "none";
+                page = 1;
+            }
+            params.append("page", page);
+
+            if (this.organizationsRequest !== null) {
+                this.organizationsRequest.abort();
+            }
+            const request = new AbortController();
+            this.organizationsRequest = request;
+
+            fetch(`${this.$organizations.dataset.url}?${params}`, {credentials: "same-origin", signal: request.signal})
+                .then(response => response.json())
+                .then(data => {
+                    data.results.forEach(organization => this.$organizations.appendChild(this.organizationElement(organization)));
+                    this.$moreOrganizations.dataset.page = data.next_page;
+                    this.$moreOrganizations.style.display = data.next_page === null ? "none" : "";
+                    if (data.count === 0) {
+                        this.feedbackMessages[3].innerText = 'Żadna organizacja nie przyjmuje wszystkich wybranych rzeczy';
+                    }
+                })
+                .catch(error => {
+                    if (error.name !== "AbortError") {
+                        // Let the next visit of step 3 try again
+                        this.organizationsQuery = null;
+                        console.error('Error loading organizations:', error);
+                    }
+                })
+                .finally(() => {
+                    if (this.organizationsRequest === request) {
+                        this.organizationsRequest = null;
+                    }
+                });
+        }
+
+        organizationElement(organization) {
+            const group = document.createElement("div");
+            group.className = "form-group form-group--checkbox";
+
+            const label = document.createElement("label");
+            const input = document.createElement("input");
+            input.type = "radio";
+            input.id = `organization-${organization.id}`;
+            input.name = "organization";
+            input.value = organization.id;
+
+            const radio = document.createElement("span");
+            radio.className = "checkbox radio";
+
+            const description = document.createElement("span");
+            description.className = "description";
+            const title = document.createElement("div");
+            title.className = "title";
+            title.textContent = organization.name;
+            const subtitle = document.createElement("div");
+            subtitle.className = "subtitle";
+            subtitle.textContent = organization.description;
+            description.append(title, subtitle);
+
+            label.append(input, radio, description);
+            group.appendChild(label);
+            return group;
         }
 
         populateSummary() {
@@ -0,0 +1,61 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are written either way
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.json', '.txt', '.xml', '.map')
+# below this size the compressed variant is not worth an extra file
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that writes content-hashed file names and, at collectstatic time,
+    gzip (and brotli, when installed) precompressed variants next to every text asset.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # a file missing from the manifest in production is a broken deploy, not something to
+            # paper over with an unhashed name
+            if settings.STATIC_MANIFEST_STRICT and not settings.DEBUG:
+                raise
+            # collectstatic has not been run yet (development, tests) - serve the plain name
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(paths) | set(self.hashed_files.values())
+        for name in names:
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+
+        for suffix, compressed in variants:
+            # keep the variant only when it actually saves bytes
+            if len(compressed) < len(content) * 0.95:
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
@@ -0,0 +1,26 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from charity_donations.critical_css import STYLESHEET, critical_css
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def stylesheet(context):
+    """
+    The site stylesheet: inline critical CSS plus an asynchronously loaded style.css for the
+    pages built with build_critical_css, a plain blocking <link> for all others.
+    """
+    href = static(STYLESHEET)
+    css = critical_css(context.template.name)
+    if css is None:
+        return format_html('<link type="text/css" href="{}" rel="stylesheet"/>', href)
+    return format_html(
+        '<style>{}</style>\n'
+        '    <link href="{}" rel="preload" as="style" onload="this.onload=null;this.rel=\'stylesheet\'"/>\n'
+        '    <noscript><link type="text/css" href="{}" rel="stylesheet"/></noscript>',
+        mark_safe(css), href, href,
+    )
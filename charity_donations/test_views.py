@@ -1,25 +1,47 @@
+import io
 import json
-from datetime import date, time
+import re
+import time as time_module
+from datetime import date, time, timedelta
 from urllib.parse import urlparse
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib import admin
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from pytest_django.asserts import assertContains, assertTemplateUsed
+from pytest_django.asserts import assertContains, assertNotContains, assertTemplateNotUsed, assertTemplateUsed
 
+from charity_donations import archive, audit, budgets, catalog, critical_css, partitions, user_cache
 from charity_donations.admin import InstitutionAdmin
+from charity_donations.budgets import BudgetExceeded, fingerprint, query_budget
 from charity_donations.forms import CustomSetPasswordForm, RegistrationForm, PasswordChangeForm, UserUpdateForm
-from charity_donations.models import Donation, Institution
+from charity_donations.middleware import EarlyHintsMiddleware
+from charity_donations.models import (ArchivedDonation, Category, ContactMessage, DataVersion, Donation,
+                                      DonationRollup, DonationStatusChange, Institution)
+from charity_donations.routers import ReplicaRouter, read_from_replica, record_latency, request_state
+from charity_donations.slow_queries import slow_query_log
+from charity_donations.versioning import VersionBump
+from charity_donations.views import DonationOrganizationsView, ProfileView
 from django.contrib.auth import get_user_model
 from django.contrib import messages
+from django.conf import settings
 
 
 @pytest.mark.django_db
@@ -481,6 +503,8 @@ def test_landing_page_view_get_pagination(donations, request_factory):
     if page_object.has_previous():
         assertContains(response, f'href="?page_foundations={page_object.previous_page_number}"')
     assertContains(response, f'Strona {page_object.number} z {paginator.num_pages}')
+    # app.js keeps the shown page of each list in its page cache under this number
+    assertContains(response, f'data-number="{page_object.number}"', count=3)
 
 
 @pytest.mark.django_db
@@ -517,14 +541,54 @@ def test_add_donation_view_get_check_for_context_in_form(user, donations, instit
     for category in categories_in_context:
         assert category in categories
 
-    organizations_in_context = response.context['organizations']
-    assert len(organizations_in_context) == len(institutions)
-    for organization in organizations_in_context:
-        assert organization in institutions
+    # step 3 is loaded from DonationOrganizations instead of being rendered for every institution
+    assert 'organizations' not in response.context
+    assertContains(response, reverse('DonationOrganizations'))
+    assert 'name="organization"' not in response.content.decode()
 
-    for organization in organizations_in_context:
-        category_ids = list(organization.categories.values_list('id', flat=True))
-        assert organization.category_ids_json == json.dumps(category_ids)
+
+@pytest.mark.django_db
+def test_donation_organizations_filters_by_all_categories(user, institutions, categories):
+    institutions[1].categories.set(categories[:1])
+    institutions[2].categories.set(categories[1:3])
+    client = Client()
+    client.force_login(user)
+    url = reverse('DonationOrganizations')
+
+    response = client.get(url, {'categories': [categories[0].pk, categories[1].pk]})
+    assert response.status_code == 200
+    data = response.json()
+    expected = [institution.pk for institution in institutions if institution.pk not in
+                (institutions[1].pk, institutions[2].pk)]
+    assert [organization['id'] for organization in data['results']] == expected
+    assert data['results'][0] == {'id': institutions[0].pk, 'name': institutions[0].name,
+                                  'description': institutions[0].description}
+
+    data = client.get(url, {'categories': [categories[2].pk]}).json()
+    assert [organization['id'] for organization in data['results']] == [
+        institution.pk for institution in institutions if institution.pk not in (institutions[1].pk,)]
+
+    # an unknown category matches nothing, a malformed one is rejected
+    assert client.get(url, {'categories': [categories[-1].pk + 1000]}).json()['count'] == 0
+    assert client.get(url, {'categories': ['x']}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_donation_organizations_pagination(user, institutions, categories, monkeypatch):
+    monkeypatch.setattr(DonationOrganizationsView, 'paginate_by', 4)
+    client = Client()
+    client.force_login(user)
+    url = reverse('DonationOrganizations')
+
+    first = client.get(url, {'categories': [categories[0].pk]}).json()
+    assert (first['count'], first['num_pages'], first['next_page']) == (10, 3, 2)
+    last = client.get(url, {'categories': [categories[0].pk], 'page': 3}).json()
+    assert last['next_page'] is None
+    assert [organization['id'] for organization in last['results']] == [institution.pk for institution in
+                                                                         institutions[8:]]
+
+    client.logout()
+    assert client.get(url).status_code == 302
 
 
 @pytest.mark.django_db
@@ -1497,3 +1561,1290 @@ def test_user_update_form(user):
     })
     assert not form.is_valid()
     assert form.errors['email'] == ['Użytkownik o podanym adresie email już istnieje!']
+
+
+@pytest.mark.django_db
+def test_collectstatic_writes_hashed_and_compressed_files(static_root, hashed_style_url):
+    name = hashed_style_url[len(settings.STATIC_URL):]
+    assert name != 'css/style.css'
+    assert (static_root / name).exists()
+    assert (static_root / f'{name}.gz').exists()
+    assert (static_root / f'{name}.br').exists()
+    # jpg files are already compressed
+    assert not list(static_root.glob('images/*.jpg.gz'))
+
+
+@pytest.mark.django_db
+def test_static_files_middleware_negotiates_encoding(static_root, hashed_style_url):
+    client = Client()
+    response = client.get(hashed_style_url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+    assert response.status_code == 200
+    assert response['Content-Encoding'] == 'br'
+    assert response['Vary'] == 'Accept-Encoding'
+    assert response['Cache-Control'] == f'public, max-age={settings.STATIC_CACHE_MAX_AGE}, immutable'
+
+    brotli_etag = response['ETag']
+
+    response = client.get(hashed_style_url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+    assert response['Content-Encoding'] == 'gzip'
+    gzip_etag = response['ETag']
+
+    response = client.get(hashed_style_url)
+    assert not response.has_header('Content-Encoding')
+    name = hashed_style_url[len(settings.STATIC_URL):]
+    assert b''.join(response.streaming_content) == (static_root / name).read_bytes()
+    assert len({brotli_etag, gzip_etag, response['ETag']}) == 3
+
+    # a validator of one encoding does not revalidate another, and 304s still vary
+    response = client.get(hashed_style_url, HTTP_IF_NONE_MATCH=brotli_etag)
+    assert response.status_code == 200
+    response = client.get(hashed_style_url, HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=brotli_etag)
+    assert response.status_code == 304
+    assert response['Vary'] == 'Accept-Encoding'
+
+
+def test_strict_manifest_rejects_uncollected_files(settings, static_root):
+    settings.STATIC_MANIFEST_STRICT = True
+    assert staticfiles_storage.url('css/style.css') != settings.STATIC_URL + 'css/style.css'
+    with pytest.raises(ValueError):
+        staticfiles_storage.url('css/not-collected.css')
+
+    settings.DEBUG = True
+    assert staticfiles_storage.url('css/not-collected.css') == settings.STATIC_URL + 'css/not-collected.css'
+
+
+@pytest.mark.django_db
+def test_static_files_middleware_unhashed_name_revalidates(static_root):
+    client = Client()
+    response = client.get(settings.STATIC_URL + 'css/style.css')
+    assert response.status_code == 200
+    assert response['Cache-Control'] == 'public, max-age=0, must-revalidate'
+
+    response = client.get(settings.STATIC_URL + 'css/style.css', HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_static_files_middleware_range_requests(static_root, hashed_style_url):
+    content = (static_root / hashed_style_url[len(settings.STATIC_URL):]).read_bytes()
+    client = Client()
+
+    response = client.get(hashed_style_url, HTTP_RANGE='bytes=10-19', HTTP_ACCEPT_ENCODING='br')
+    assert response.status_code == 206
+    assert response.content == content[10:20]
+    assert response['Content-Range'] == f'bytes 10-19/{len(content)}'
+    assert not response.has_header('Content-Encoding')
+
+    response = client.get(hashed_style_url, HTTP_RANGE='bytes=-5')
+    assert response.status_code == 206
+    assert response.content == content[-5:]
+
+    response = client.get(hashed_style_url, HTTP_RANGE=f'bytes={len(content)}-')
+    assert response.status_code == 416
+
+
+@pytest.mark.django_db
+def test_static_files_middleware_falls_through_for_unknown_files(static_root):
+    client = Client()
+    response = client.get(settings.STATIC_URL + '../manage.py')
+    assert response.status_code == 404
+    response = client.get(settings.STATIC_URL + 'css/missing.css')
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_landing_page_view_conditional_get(donations, django_assert_max_num_queries):
+    client = Client()
+    url = reverse('LandingPage')
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response['ETag']
+    assert etag.startswith('W/"')
+    assert response.has_header('Last-Modified')
+
+    with django_assert_max_num_queries(1):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    # AJAX pagination hits the same view
+    with django_assert_max_num_queries(1):
+        response = client.get(url, {'page_foundations': 2}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_landing_page_view_etag_changes_with_data(donations, institutions, categories,
+                                                 django_capture_on_commit_callbacks):
+    client = Client()
+    url = reverse('LandingPage')
+    etag = client.get(url)['ETag']
+
+    # the versions are bumped once the change commits
+    with django_capture_on_commit_callbacks(execute=True):
+        Institution.objects.create(name='New one', description='desc', type=Institution.NGO)
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+    etag = response['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        donations[0].categories.remove(categories[0])
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_data_version_is_bumped_once_after_commit(donations, django_capture_on_commit_callbacks):
+    before = DataVersion.objects.get(key=DataVersion.DONATIONS).version
+    with CaptureQueriesContext(connection) as queries:
+        with django_capture_on_commit_callbacks() as callbacks:
+            donations[0].is_taken = True
+            donations[0].save()
+            donations[1].categories.clear()
+    # the shared row is not locked by the writer's transaction
+    assert not [query for query in queries if DataVersion._meta.db_table in query['sql']]
+    assert len([callback for callback in callbacks if isinstance(callback, VersionBump)]) == 1
+
+    for callback in callbacks:
+        callback()
+    assert DataVersion.objects.get(key=DataVersion.DONATIONS).version == before + 1
+
+@pytest.mark.django_db
+def test_landing_page_view_etag_differs_per_user(user, donations):
+    client = Client()
+    url = reverse('LandingPage')
+    anonymous_etag = client.get(url)['ETag']
+
+    client.force_login(user)
+    response = client.get(url, HTTP_IF_NONE_MATCH=anonymous_etag)
+    assert response.status_code == 200
+    assert response['ETag'] != anonymous_etag
+
+
+@pytest.mark.django_db
+def test_landing_page_view_anonymous_is_shared_cacheable(donations):
+    client = Client()
+    response = client.get(reverse('LandingPage'))
+    assert response.status_code == 200
+    assert not response.cookies
+    assert not response.wsgi_request.session.accessed
+    assert 'public' in response['Cache-Control']
+    assert f's-maxage={settings.SHARED_CACHE_MAX_AGE}' in response['Cache-Control']
+    assert 'csrfmiddlewaretoken' not in response.content.decode('utf-8')
+    assertContains(response, f'data-csrf-url="{reverse("CsrfToken")}"')
+
+
+@pytest.mark.django_db
+def test_landing_page_view_logged_in_is_private(user, donations):
+    client = Client()
+    client.force_login(user)
+    response = client.get(reverse('LandingPage'))
+    assert response.status_code == 200
+    assert 'private' in response['Cache-Control']
+    assert 'public' not in response['Cache-Control']
+    assertContains(response, 'csrfmiddlewaretoken')
+
+
+@pytest.mark.django_db
+def test_csrf_token_view():
+    client = Client(enforce_csrf_checks=True)
+    response = client.get(reverse('CsrfToken'))
+    assert response.status_code == 200
+    assert 'no-cache' in response['Cache-Control']
+    token = response.json()['token']
+    assert settings.CSRF_COOKIE_NAME in response.cookies
+
+    data = {'name': 'me', 'surname': 'also me', 'message': 'this is my message', 'csrfmiddlewaretoken': token}
+    response = client.post(reverse('Contact'), data)
+    assert response.status_code == 302
+
+
+def test_fingerprint_groups_queries_with_different_values():
+    first = fingerprint('SELECT * FROM "donation" WHERE "id" IN (%s, %s, %s) LIMIT 21')
+    second = fingerprint("SELECT *  FROM \"donation\"\nWHERE \"id\" IN (%s) LIMIT 3")
+    assert first == second == 'SELECT * FROM "donation" WHERE "id" IN (...) LIMIT ?'
+    assert fingerprint("SELECT 'a''b', 1.5") == 'SELECT ?, ?'
+
+
+@pytest.mark.django_db
+def test_query_budget_raises_on_violation(categories):
+    @query_budget(max_queries=1)
+    def view():
+        list(Category.objects.all())
+        list(Institution.objects.all())
+
+    with pytest.raises(BudgetExceeded) as exc_info:
+        view()
+    assert '2 queries > 1' in str(exc_info.value)
+
+
+def test_query_budget_raises_on_duration_only_when_enabled(settings, caplog, monkeypatch):
+    settings.QUERY_BUDGET_SAMPLE_RATE = 1.0
+    clock = iter([0, 1, 10, 11])
+    monkeypatch.setattr(budgets.time, 'perf_counter', lambda: next(clock))
+
+    @query_budget(max_duration_ms=500)
+    def view():
+        return 'slow'
+
+    assert view() == 'slow'
+    assert caplog.records[0].budget['violations'] == ['1000 ms > 500 ms']
+
+    settings.QUERY_BUDGET_RAISE_ON_DURATION = True
+    with pytest.raises(BudgetExceeded):
+        view()
+
+
+@pytest.mark.django_db
+def test_query_budget_logs_sampled_warning(settings, caplog, categories):
+    settings.QUERY_BUDGET_RAISE = False
+    settings.QUERY_BUDGET_SAMPLE_RATE = 1.0
+
+    @query_budget(max_queries=0)
+    def view():
+        return list(Category.objects.all())
+
+    assert len(view()) == len(categories)
+    assert len(caplog.records) == 1
+    report = caplog.records[0].budget
+    assert report['queries'] == 1
+    assert report['fingerprints'][0][0].startswith('SELECT')
+
+
+@pytest.mark.django_db
+def test_views_stay_within_query_budgets_with_more_data(user, institutions, categories):
+    for i in range(3):
+        for institution_type, _ in Institution.INSTITUTION_TYPES:
+            institution = Institution.objects.create(name=f'{institution_type} {i}', description='d',
+                                                     type=institution_type)
+            institution.categories.set(categories)
+    for i in range(30):
+        donation = Donation.objects.create(
+            quantity=1, institution=institutions[i % len(institutions)], address='Street', phone_number='1',
+            city='City', zip_code='12345', pick_up_date=date.today(), pick_up_time=time(10, 0), user=user,
+        )
+        donation.categories.set(categories[:3])
+
+    client = Client()
+    client.force_login(user)
+    # budgets raise BudgetExceeded in tests, so N+1 queries in templates would fail here
+    assert client.get(reverse('LandingPage')).status_code == 200
+    assert client.get(reverse('AddDonation')).status_code == 200
+    assert client.get(reverse('Profile')).status_code == 200
+
+
+@pytest.fixture
+def profiling_dir(settings, tmp_path):
+    settings.PROFILING_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.django_db
+def test_profiling_middleware_profiles_staff_request(superusers, donations, profiling_dir):
+    client = Client()
+    client.force_login(superusers[0])
+    response = client.get(reverse('LandingPage'), {'_profile': 1})
+    assert response.status_code == 200
+    report_url = response['X-Profile-Report']
+    name = report_url.rsplit('/', 1)[1][:-len('.html')]
+    assert (profiling_dir / f'{name}.prof').exists()
+    assert (profiling_dir / f'{name}.html').exists()
+
+    response = client.get(report_url)
+    assert response.status_code == 200
+    report = b''.join(response.streaming_content).decode('utf-8')
+    assert 'SQL timeline' in report
+    assert 'charity_donations_institution' in report
+
+    response = client.get(reverse('ProfilingReport', args=[f'{name}.prof']))
+    assert response.status_code == 200
+    assert 'attachment' in response['Content-Disposition']
+
+
+@pytest.mark.django_db
+def test_profiling_middleware_ignores_non_staff(user, profiling_dir):
+    client = Client()
+    client.force_login(user)
+    response = client.get(reverse('Profile'), HTTP_X_PROFILE='1')
+    assert response.status_code == 200
+    assert not response.has_header('X-Profile-Report')
+    assert not list(profiling_dir.iterdir())
+
+    response = client.get(reverse('ProfilingReport', args=['20240101-000000-000000-0123abcd.html']))
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_profiling_reports_are_a_bounded_ring_buffer(superusers, settings, profiling_dir):
+    settings.PROFILING_MAX_REPORTS = 2
+    client = Client()
+    client.force_login(superusers[0])
+    names = [client.get(reverse('Profile'), HTTP_X_PROFILE='1')['X-Profile-Report'] for _ in range(4)]
+    assert len(list(profiling_dir.glob('*.prof'))) == 2
+    assert len(list(profiling_dir.glob('*.html'))) == 2
+    assert client.get(names[-1]).status_code == 200
+    assert client.get(reverse('ProfilingReport', args=['settings.py'])).status_code == 404
+
+
+@pytest.fixture
+def slow_query_log_file(settings, tmp_path):
+    settings.SLOW_QUERY_LOG_FILE = str(tmp_path / 'slow_queries.jsonl')
+    settings.SLOW_QUERY_THRESHOLD_MS = 0
+    settings.SLOW_QUERY_SAMPLE_RATE = 1.0
+    slow_query_log.flush()
+    yield tmp_path / 'slow_queries.jsonl'
+    slow_query_log.entries = {}
+
+
+@pytest.mark.django_db
+def test_slow_query_log_records_call_sites(user, donations, slow_query_log_file):
+    client = Client()
+    client.force_login(user)
+    assert client.get(reverse('Profile')).status_code == 200
+    slow_query_log.flush()
+
+    entries = [json.loads(line) for line in slow_query_log_file.read_text().splitlines()]
+    call_sites = [site for entry in entries for site in entry['call_sites']]
+    assert any('charity_donations/views.py' in site and 'profile.html' in site for site in call_sites)
+    for entry in entries:
+        assert entry['count'] >= 1
+        assert entry['max_ms'] <= entry['total_ms'] + 0.001
+
+
+@pytest.mark.django_db
+def test_slow_query_log_aggregates_fingerprints(categories, slow_query_log_file):
+    for category in categories:
+        Category.objects.filter(pk=category.pk).first()
+    slow_query_log.flush()
+
+    entries = [json.loads(line) for line in slow_query_log_file.read_text().splitlines()]
+    selects = [entry for entry in entries if 'charity_donations_category' in entry['fingerprint']
+               and entry['fingerprint'].startswith('SELECT')]
+    assert len(selects) == 1
+    assert selects[0]['count'] == len(categories)
+    assert list(selects[0]['call_sites'].values()) == [len(categories)]
+
+
+@pytest.mark.django_db
+def test_slow_query_log_respects_threshold_and_sampling(settings, categories, slow_query_log_file):
+    settings.SLOW_QUERY_THRESHOLD_MS = 10_000
+    list(Category.objects.all())
+    settings.SLOW_QUERY_THRESHOLD_MS = 0
+    settings.SLOW_QUERY_SAMPLE_RATE = 0
+    list(Category.objects.all())
+    slow_query_log.flush()
+    assert not slow_query_log_file.exists()
+
+
+def test_replica_router_reads_from_replicas_only_in_read_only_views(settings):
+    settings.DATABASE_REPLICAS = ['replica_0', 'replica_1']
+    settings.DATABASE_REPLICA_SELECTION = 'round_robin'
+    router = ReplicaRouter()
+    assert router.db_for_read(Donation) is None
+    assert router.db_for_write(Donation) == 'default'
+
+    @read_from_replica
+    def view():
+        return {router.db_for_read(Donation) for _ in range(4)}
+
+    # one replica per view call, round robin between calls
+    first, second = view(), view()
+    assert len(first) == len(second) == 1
+    assert first | second == {'replica_0', 'replica_1'}
+    assert router.db_for_read(Donation) is None
+
+
+def test_replica_router_least_latency(settings):
+    settings.DATABASE_REPLICAS = ['replica_0', 'replica_1']
+    settings.DATABASE_REPLICA_SELECTION = 'least_latency'
+    record_latency('replica_0', 50)
+    record_latency('replica_1', 5)
+    assert read_from_replica(lambda: ReplicaRouter().db_for_read(Donation))() == 'replica_1'
+    for _ in range(20):
+        record_latency('replica_1', 500)
+    assert read_from_replica(lambda: ReplicaRouter().db_for_read(Donation))() == 'replica_0'
+
+
+def test_replica_router_pinned_visitor_reads_primary(settings):
+    settings.DATABASE_REPLICAS = ['replica_0']
+    token = request_state.set({'pinned': True, 'wrote': False})
+    try:
+        assert read_from_replica(lambda: ReplicaRouter().db_for_read(Donation))() is None
+    finally:
+        request_state.reset(token)
+
+
+@pytest.mark.django_db
+def test_replica_pinning_middleware_pins_after_write(settings, user, donations):
+    settings.DATABASE_REPLICAS = ['replica_0']
+    client = Client()
+    client.force_login(user)
+
+    response = client.get(reverse('Login'))
+    assert settings.REPLICA_PIN_COOKIE_NAME not in response.cookies
+
+    response = client.post(reverse('Profile'), {f'is_taken_{donations[0].id}': 'true'})
+    assert response.status_code == 302
+    cookie = response.cookies[settings.REPLICA_PIN_COOKIE_NAME]
+    assert cookie['max-age'] == settings.REPLICA_PIN_SECONDS
+    assert float(cookie.value) > time_module.time()
+
+
+def test_donation_partition_ranges():
+    assert partitions.add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert partitions.add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert list(partitions.months_between(date(2024, 11, 15), date(2025, 1, 1))) == [
+        date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1)]
+
+    name = partitions.partition_name(date(2024, 7, 1))
+    assert name == 'charity_donations_donation_p2024_07'
+    assert partitions.partition_month(name) == date(2024, 7, 1)
+    assert partitions.partition_month('charity_donations_donation_default') is None
+    assert partitions.create_partition_sql(date(2024, 12, 1)).endswith(
+        "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')")
+
+
+@pytest.mark.django_db
+def test_partition_donations_command_needs_postgresql():
+    if connection.vendor == 'postgresql':
+        pytest.skip('runs against the local PostgreSQL database')
+    with pytest.raises(CommandError):
+        call_command('partition_donations', 'create')
+
+
+@pytest.mark.django_db
+def test_partition_donations_on_postgresql(user, donations, categories, institutions):
+    if connection.vendor != 'postgresql':
+        pytest.skip('needs a local PostgreSQL database')
+    Donation.objects.filter(pk=donations[0].pk).update(pick_up_date=date(2023, 1, 15))
+
+    out = io.StringIO()
+    call_command('partition_donations', 'convert', '--months-ahead', '2', stdout=out)
+    assert 'Converted' in out.getvalue()
+    with connection.cursor() as cursor:
+        assert partitions.is_partitioned(cursor)
+        names = partitions.existing_partitions(cursor)
+    assert partitions.partition_name(date(2023, 1, 1)) in names
+    assert Donation.objects.count() == len(donations)
+
+    # the ORM keeps working on the partitioned table
+    donation = Donation.objects.create(
+        quantity=3, institution=institutions[0], address='Street', phone_number='1', city='City',
+        zip_code='12345', pick_up_date=date.today(), pick_up_time=time(10, 0), user=user,
+    )
+    donation.categories.set(categories[:2])
+    assert donation.pk > max(d.pk for d in donations)
+    client = Client()
+    client.force_login(user)
+    assert client.get(reverse('Profile')).status_code == 200
+
+    out = io.StringIO()
+    call_command('partition_donations', 'explain', '--user-id', str(user.pk), stdout=out)
+    pending = next(line for line in out.getvalue().splitlines() if line.startswith('pending pick-ups'))
+    scanned, total = re.match(r'pending pick-ups: (\d+) of (\d+)', pending).groups()
+    assert int(scanned) < int(total)
+
+    # a donation scheduled past the last partition goes to the default one and moves out of it
+    # when its month gets a partition
+    far_ahead = partitions.add_months(partitions.month_start(date.today()), 6).replace(day=10)
+    scheduled = Donation.objects.create(
+        quantity=2, institution=institutions[0], address='Street', phone_number='1', city='City',
+        zip_code='12345', pick_up_date=far_ahead, pick_up_time=time(10, 0), user=user,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id FROM {partitions.DEFAULT_PARTITION}')
+        assert cursor.fetchall() == [(scheduled.pk,)]
+    call_command('partition_donations', 'create', '--months-ahead', '8', stdout=io.StringIO())
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id FROM {partitions.partition_name(partitions.month_start(far_ahead))}')
+        assert cursor.fetchall() == [(scheduled.pk,)]
+        cursor.execute(f'SELECT COUNT(*) FROM {partitions.DEFAULT_PARTITION}')
+        assert cursor.fetchone()[0] == 0
+    assert Donation.objects.filter(pk=scheduled.pk).exists()
+
+    # an old partition with a donation not collected yet stays attached
+    old_partition = partitions.partition_name(date(2023, 1, 1))
+    out = io.StringIO()
+    call_command('partition_donations', 'detach', '--keep-months', '0', stdout=out)
+    assert f'Kept 1 partitions holding donations not collected yet: {old_partition}' in out.getvalue()
+    with connection.cursor() as cursor:
+        names = partitions.existing_partitions(cursor)
+    assert old_partition in names
+    assert partitions.partition_name(date(2023, 2, 1)) not in names
+
+    # once collected it is archived with its categories, then the empty partition is detached
+    Donation.objects.filter(pk=donations[0].pk).update(is_taken=True)
+    call_command('partition_donations', 'detach', '--keep-months', '0', stdout=io.StringIO())
+    with connection.cursor() as cursor:
+        assert old_partition not in partitions.existing_partitions(cursor)
+    archived = ArchivedDonation.objects.get(pk=donations[0].pk)
+    assert archived.category_ids == [category.pk for category in categories]
+    assert not Donation.categories.through.objects.filter(donation_id=donations[0].pk).exists()
+
+
+@pytest.mark.django_db
+def test_purge_inactive_users_command(user):
+    old = timezone.now() - timedelta(days=30)
+    for i in range(5):
+        User.objects.create_user(username=f'bot{i}', password='Random?1', is_active=False)
+    User.objects.create_user(username='recent', password='Random?1', is_active=False)
+    User.objects.create_user(username='deactivated', password='Random?1', is_active=False, last_login=old)
+    User.objects.create_user(username='inactive_staff', password='Random?1', is_active=False, is_staff=True)
+    User.objects.exclude(username='recent').update(date_joined=old)
+
+    out = io.StringIO()
+    call_command('purge_inactive_users', '--dry-run', stdout=out)
+    assert '5 never activated accounts would be deleted.' in out.getvalue()
+    assert User.objects.count() == 9
+
+    out = io.StringIO()
+    call_command('purge_inactive_users', '--batch-size', '2', '--sleep', '0', stdout=out)
+    assert 'accounts: 4 deleted so far' in out.getvalue()
+    assert 'Deleted 5 never activated accounts.' in out.getvalue()
+    assert set(User.objects.values_list('username', flat=True)) == {
+        user.username, 'recent', 'deactivated', 'inactive_staff'}
+
+
+@pytest.mark.django_db
+def test_purge_inactive_users_deletes_expired_sessions(user):
+    Session.objects.create(session_key='expired', session_data='', expire_date=timezone.now() - timedelta(days=1))
+    Session.objects.create(session_key='valid', session_data='', expire_date=timezone.now() + timedelta(days=1))
+    call_command('purge_inactive_users', '--sleep', '0', stdout=io.StringIO())
+    assert list(Session.objects.values_list('session_key', flat=True)) == ['valid']
+
+
+@pytest.mark.django_db
+def test_catalog_is_served_from_snapshot_in_steady_state(user, institutions, categories):
+    client = Client()
+    client.force_login(user)
+    # first requests load the snapshot of the current catalog version
+    client.get(reverse('LandingPage'))
+    client.get(reverse('AddDonation'))
+
+    catalog_tables = (Institution._meta.db_table, Category._meta.db_table, DataVersion._meta.db_table)
+    for url in (reverse('LandingPage'), reverse('AddDonation')):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        # the donation counters of the landing page are live data, not part of the catalog
+        assert not [query['sql'] for query in queries
+                    if any(table in query['sql'] for table in catalog_tables) and 'total_bags' not in query['sql']]
+
+
+@pytest.mark.django_db
+def test_catalog_load_ignores_category_linked_while_loading(institutions, categories):
+    linked = []
+
+    def link_new_category(execute, sql, params, many, context):
+        # a category is created and linked between the categories and the institutions query
+        if not linked and Institution._meta.db_table in sql:
+            linked.append(Category.objects.create(name='linked while loading'))
+            institutions[0].categories.add(linked[0])
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(link_new_category):
+        snapshot = catalog.load_catalog((1, None))
+    assert linked[0] not in snapshot.categories
+    assert snapshot.institutions_covering([categories[0].pk])[0] == institutions[0]
+
+@pytest.mark.django_db
+def test_catalog_snapshot_reloads_after_admin_edit(user, institutions, categories,
+                                                   django_capture_on_commit_callbacks):
+    client = Client()
+    client.force_login(user)
+    client.get(reverse('AddDonation'))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        institution = Institution.objects.create(name='Brand new', description='desc', type=Institution.NGO)
+        institution.categories.set(categories[:2])
+    response = client.get(reverse('DonationOrganizations'), {'categories': [categories[0].pk, categories[1].pk]})
+    assert institution.pk in [organization['id'] for organization in response.json()['results']]
+    response = client.get(reverse('DonationOrganizations'), {'categories': [categories[2].pk]})
+    assert institution.pk not in [organization['id'] for organization in response.json()['results']]
+
+
+@pytest.mark.django_db
+def test_contact_view_post_stores_message_without_sending(superusers):
+    client = Client()
+    client.post(reverse('Contact'), {'name': 'me', 'surname': 'also me', 'message': 'this is my message'})
+    assert len(mail.outbox) == 0
+    contact_message = ContactMessage.objects.get()
+    assert contact_message.message == 'this is my message'
+    assert contact_message.sent_at is None
+
+
+@pytest.mark.django_db
+def test_send_contact_digest_command(superusers, django_assert_num_queries):
+    for i in range(3):
+        ContactMessage.objects.create(name=f'name{i}', surname='surname', message=f'message {i}')
+
+    out = io.StringIO()
+    call_command('send_contact_digest', stdout=out)
+    assert 'Sent 3 messages to 3 recipients.' in out.getvalue()
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].to == []
+    assert sorted(mail.outbox[0].bcc) == [superuser.email for superuser in superusers]
+    assert 'message 2' in mail.outbox[0].body
+    assert not ContactMessage.objects.filter(sent_at__isnull=True).exists()
+
+    out = io.StringIO()
+    call_command('send_contact_digest', stdout=out)
+    assert 'No messages to send.' in out.getvalue()
+    assert len(mail.outbox) == 1
+
+    # recipients come from the cache: select pending + claiming update inside a savepoint, then sent_at
+    ContactMessage.objects.create(name='late', surname='surname', message='late message')
+    with django_assert_num_queries(5):
+        call_command('send_contact_digest', stdout=io.StringIO())
+    assert len(mail.outbox) == 2
+
+
+def delivered_to(outbox):
+    return sorted(recipient for email in outbox for recipient in email.recipients())
+
+
+@pytest.mark.django_db
+def test_send_contact_digest_releases_messages_when_sending_fails(superusers, monkeypatch):
+    ContactMessage.objects.create(name='name', surname='surname', message='message')
+
+    def send_messages(self, messages):
+        # mail is sent after the claiming transaction (a savepoint in tests) has ended
+        assert not connection.savepoint_ids
+        # like the SMTP backend: the messages go out one by one and the second one fails
+        for number, message in enumerate(messages):
+            if number:
+                raise ConnectionRefusedError
+            mail.outbox.append(message)
+        return len(messages)
+
+    monkeypatch.setattr('django.core.mail.backends.locmem.EmailBackend.send_messages', send_messages)
+    call_command('send_contact_digest', stdout=io.StringIO())
+    monkeypatch.undo()
+    call_command('send_contact_digest', stdout=io.StringIO())
+    # a single message for all superusers: nobody got a part that the retry sends again
+    assert delivered_to(mail.outbox) == [superuser.email for superuser in superusers]
+
+    def refused(self, messages):
+        raise ConnectionRefusedError
+
+    ContactMessage.objects.create(name='name', surname='surname', message='retried')
+    monkeypatch.setattr('django.core.mail.backends.locmem.EmailBackend.send_messages', refused)
+    with pytest.raises(ConnectionRefusedError):
+        call_command('send_contact_digest', stdout=io.StringIO())
+    failed = ContactMessage.objects.get(message='retried')
+    assert (failed.claimed_at, failed.sent_at) == (None, None)
+
+    monkeypatch.undo()
+    call_command('send_contact_digest', stdout=io.StringIO())
+    assert ContactMessage.objects.get(message='retried').sent_at is not None
+    assert len(mail.outbox) == 2
+
+
+@pytest.mark.django_db
+def test_send_contact_digest_retries_claims_of_a_dead_run(superusers, monkeypatch, settings):
+    ContactMessage.objects.create(name='name', surname='surname', message='message')
+
+    def killed(self, messages):
+        # the process dies between the committed claim and the send, the except clause never runs
+        raise SystemExit
+
+    monkeypatch.setattr('django.core.mail.backends.locmem.EmailBackend.send_messages', killed)
+    with pytest.raises(SystemExit):
+        call_command('send_contact_digest', stdout=io.StringIO())
+    monkeypatch.undo()
+    contact_message = ContactMessage.objects.get()
+    assert contact_message.claimed_at is not None
+    assert contact_message.sent_at is None
+
+    # the claim holds off other runs until it expires
+    out = io.StringIO()
+    call_command('send_contact_digest', stdout=out)
+    assert 'No messages to send.' in out.getvalue()
+
+    ContactMessage.objects.update(claimed_at=timezone.now() - timedelta(seconds=settings.CONTACT_DIGEST_CLAIM_TIMEOUT + 1))
+    out = io.StringIO()
+    call_command('send_contact_digest', stdout=out)
+    assert 'Sent 1 messages to 3 recipients.' in out.getvalue()
+    assert delivered_to(mail.outbox) == [superuser.email for superuser in superusers]
+    assert ContactMessage.objects.get().sent_at is not None
+
+
+@pytest.mark.django_db
+def test_contact_recipients_follow_superuser_changes(superusers):
+    ContactMessage.objects.create(name='name', surname='surname', message='message')
+    call_command('send_contact_digest', stdout=io.StringIO())
+    assert len(mail.outbox[0].bcc) == 3
+
+    superusers[0].is_superuser = False
+    superusers[0].save()
+    ContactMessage.objects.create(name='name', surname='surname', message='message')
+    call_command('send_contact_digest', stdout=io.StringIO())
+    assert sorted(mail.outbox[1].bcc) == [superuser.email for superuser in superusers[1:]]
+
+
+@pytest.mark.django_db
+def test_contact_message_admin_shows_backlog(superusers):
+    ContactMessage.objects.create(name='name', surname='surname', message='message')
+    client = Client()
+    client.force_login(superusers[0])
+    response = client.get(reverse('admin:charity_donations_contactmessage_changelist'))
+    assertContains(response, '1 waiting for the next digest')
+
+
+def rollup_rows():
+    return set(DonationRollup.objects.filter(donations__gt=0)
+               .values_list('day', 'institution_id', 'category_id', 'city', 'bags', 'donations'))
+
+
+@pytest.mark.django_db
+def test_donation_rollups_follow_donation_changes(donations, institutions, categories, user):
+    client = Client()
+    client.force_login(user)
+    client.post(reverse('AddDonation'), {
+        'bags': '3', 'categories': [categories[0].id, categories[1].id], 'organization': institutions[1].id,
+        'address': 'Street', 'city': 'Other', 'postcode': '12345', 'phone': '123456789',
+        'date': '2024-05-01', 'time': '10:00', 'more_info': '',
+    })
+    assert DonationRollup.objects.get(day=date(2024, 5, 1), category__isnull=True).bags == 3
+
+    donations[0].quantity = 2
+    donations[0].city = 'Elsewhere'
+    donations[0].save()
+    donations[1].categories.remove(categories[0], categories[0].id + 1000)
+    donations[2].categories.clear()
+    donations[3].delete()
+    categories[5].donation_set.remove(donations[4])
+    categories[5].donation_set.add(donations[4])
+    Donation.objects.filter(pk=donations[5].pk).only('id').get().save()  # deferred fields
+
+    incremental = rollup_rows()
+    call_command('rebuild_donation_rollups', stdout=io.StringIO())
+    assert incremental == rollup_rows()
+    assert DonationRollup.objects.get(day=date.today(), institution=institutions[0], category__isnull=True,
+                                      city='Elsewhere').bags == 2
+
+
+@pytest.mark.django_db
+def test_rebuild_donation_rollups_command(donations, categories):
+    DonationRollup.objects.all().delete()
+    out = io.StringIO()
+    call_command('rebuild_donation_rollups', '--since', date.today().isoformat(), stdout=out)
+    assert 'Replaced 0 rollup rows with 110.' in out.getvalue()
+    totals = DonationRollup.objects.filter(category__isnull=True)
+    assert sum(totals.values_list('bags', flat=True)) == 70
+    assert DonationRollup.objects.filter(category=categories[0]).count() == 10
+
+    with pytest.raises(CommandError):
+        call_command('rebuild_donation_rollups', '--since', 'yesterday')
+
+
+@pytest.mark.django_db
+def test_donation_stats_view(donations, superusers, user):
+    client = Client()
+    client.force_login(user)
+    assert client.get(reverse('DonationStats')).status_code == 403
+
+    client.force_login(superusers[0])
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('DonationStats'))
+    assert response.status_code == 200
+    assert not [query['sql'] for query in queries if Donation._meta.db_table + '"' in query['sql']]
+    assert response.context['summary'] == {'bags': 70, 'donations': 10}
+    charts = dict(response.context['charts'])
+    assert charts['Miasta'] == [{'label': 'City', 'bags': 70, 'donations': 10, 'percent': 100.0}]
+    assert charts['Organizacje'][0]['label'] == 'Institution 0'
+    assert charts['Kategorie'][0]['label'].startswith('category')
+
+    response = client.get(reverse('DonationStats'), {'from': '2000-01-01', 'to': '2000-12-31'})
+    assertContains(response, 'Brak darów w wybranym okresie.')
+
+
+@pytest.mark.django_db
+def test_institution_counters_follow_donations(donations, institutions):
+    institution = Institution.objects.get(pk=institutions[0].pk)
+    assert (institution.total_bags, institution.donation_count, institution.last_donation_date) == \
+           (7, 1, date.today())
+
+    donation = Donation.objects.get(pk=donations[0].pk)
+    donation.quantity = 3
+    donation.pick_up_date = date(2020, 1, 1)
+    donation.save()
+    institution.refresh_from_db()
+    assert (institution.total_bags, institution.donation_count, institution.last_donation_date) == \
+           (3, 1, date(2020, 1, 1))
+
+    donation.institution = institutions[1]
+    donation.save()
+    institution.refresh_from_db()
+    assert (institution.total_bags, institution.donation_count, institution.last_donation_date) == (0, 0, None)
+    other = Institution.objects.get(pk=institutions[1].pk)
+    assert (other.total_bags, other.donation_count, other.last_donation_date) == (10, 2, date.today())
+
+    Donation.objects.get(pk=donations[1].pk).delete()
+    other.refresh_from_db()
+    assert (other.total_bags, other.donation_count, other.last_donation_date) == (3, 1, date(2020, 1, 1))
+
+
+@pytest.mark.django_db
+def test_landing_page_most_supported_without_donation_queries(donations, institutions):
+    Donation.objects.filter(pk=donations[2].pk).get().delete()
+    donations[3].quantity = 20
+    donations[3].save()
+
+    client = Client()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('LandingPage'))
+    assert not [query['sql'] for query in queries if Donation._meta.db_table + '"' in query['sql']]
+    assert response.context['number_of_bags'] == 76
+    assert response.context['number_of_institutions'] == 9
+    assert [institution.pk for institution in response.context['most_supported']][0] == institutions[3].pk
+    assertContains(response, 'Najczęściej wspierane')
+
+
+@pytest.mark.django_db
+def test_reconcile_institution_counters_command(donations, institutions):
+    Institution.objects.filter(pk=institutions[0].pk).update(total_bags=100, donation_count=5)
+    Donation.objects.filter(pk=donations[1].pk).update(quantity=1)  # bypasses the signals
+
+    out = io.StringIO()
+    call_command('reconcile_institution_counters', '--dry-run', stdout=out)
+    assert '2 institutions would be fixed.' in out.getvalue()
+
+    out = io.StringIO()
+    call_command('reconcile_institution_counters', stdout=out)
+    assert '2 institutions fixed.' in out.getvalue()
+    assert Institution.objects.get(pk=institutions[0].pk).total_bags == 7
+    assert Institution.objects.get(pk=institutions[1].pk).total_bags == 1
+
+    out = io.StringIO()
+    call_command('reconcile_institution_counters', stdout=out)
+    assert '0 institutions fixed.' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_institution_admin_lists_counters(superusers, donations):
+    client = Client()
+    client.force_login(superusers[0])
+    response = client.get(reverse('admin:charity_donations_institution_changelist'))
+    assert response.status_code == 200
+    assertContains(response, 'column-total_bags')
+
+
+@pytest.mark.django_db
+def test_saving_institution_keeps_counters_updated_meanwhile(user, institutions):
+    stale = Institution.objects.get(pk=institutions[0].pk)
+    Donation.objects.create(quantity=4, institution=institutions[0], address='Street', phone_number='1', city='City',
+                            zip_code='12345', pick_up_date=date.today(), pick_up_time=time(10, 0), user=user)
+
+    stale.name = 'Renamed'
+    stale.save()
+    institution = Institution.objects.get(pk=institutions[0].pk)
+    assert institution.name == 'Renamed'
+    assert (institution.total_bags, institution.donation_count) == (4, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_loadtest_command_against_live_server(live_server, user, donations, tmp_path):
+    user.set_password('Random?1')
+    user.save()
+    output = tmp_path / 'report.json'
+    # the live server threads share one in-memory SQLite connection, which can't take concurrent users
+    users = '1' if connection.vendor == 'sqlite' else '2'
+    call_command('loadtest', '--url', live_server.url, '--users', users, '--duration', '2', '--ramp-up', '0.5',
+                 '--mix', 'landing=2,donation=1,profile=1', '--username', user.username, '--password', 'Random?1',
+                 '--seed', '1', '--output', str(output), stdout=io.StringIO())
+
+    report = json.loads(output.read_text())
+    assert report['total']['requests'] > 0
+    assert report['total']['errors'] == 0
+    assert {'landing', 'login', 'donation_form', 'donation_organizations', 'donation_post', 'profile'} <= set(
+        report['requests'])
+    assert report['requests']['landing']['latency_ms']['p50'] <= report['requests']['landing']['latency_ms']['max']
+    assert Donation.objects.filter(pick_up_comment='loadtest').exists()
+
+
+def test_loadtest_command_validates_options():
+    with pytest.raises(CommandError):
+        call_command('loadtest', '--mix', 'checkout=1')
+    with pytest.raises(CommandError):
+        call_command('loadtest', '--mix', 'landing=1,profile=1')
+
+
+def test_profile_startup_command(monkeypatch):
+    # ALLOWED_HOSTS is empty, the child process only accepts localhost in debug mode
+    monkeypatch.setenv('DEBUG', 'True')
+    stdout = io.StringIO()
+    call_command('profile_startup', '--path', '/login/', '--host', 'localhost', '--repeat', '1', '--top', '5', '--json',
+                 stdout=stdout)
+    report = json.loads(stdout.getvalue())
+    assert report['status'] == 200
+    assert report['import_ms'] > 0 and report['first_request_ms'] > 0
+    assert len(report['top_imports']) == 5
+    assert 'charity_donations.views' in {item['module'] for item in report['app_imports']}
+
+
+def make_donation(user, institution, categories, pick_up_date, is_taken=True, quantity=3):
+    donation = Donation.objects.create(
+        quantity=quantity, institution=institution, address='Street', phone_number='1', city='City',
+        zip_code='12345', pick_up_date=pick_up_date, pick_up_time=time(10, 0), user=user, is_taken=is_taken,
+    )
+    donation.categories.set(categories)
+    return donation
+
+
+@pytest.mark.django_db
+def test_archive_donations_command(user, institutions, categories):
+    old = date.today() - timedelta(days=400)
+    archived = [make_donation(user, institutions[i % 2], categories[:2], old - timedelta(days=i)) for i in range(5)]
+    pending = make_donation(user, institutions[0], categories[:1], old, is_taken=False)
+    recent = make_donation(user, institutions[1], categories[:1], date.today())
+    rollup_rows = DonationRollup.objects.order_by('day', 'institution', 'category', 'city').values_list(
+        'day', 'institution', 'category', 'city', 'bags', 'donations')
+    rollups = list(rollup_rows)
+    counters = list(Institution.objects.order_by('pk').values('total_bags', 'donation_count', 'last_donation_date'))
+
+    out = io.StringIO()
+    call_command('archive_donations', '--dry-run', stdout=out)
+    assert '5 donations would be archived.' in out.getvalue()
+    call_command('archive_donations', '--batch-size', '2', '--sleep', '0', stdout=out)
+    assert 'Archived 5 donations.' in out.getvalue()
+
+    assert set(Donation.objects.values_list('pk', flat=True)) == {pending.pk, recent.pk}
+    assert not Donation.categories.through.objects.filter(donation_id__in=[d.pk for d in archived]).exists()
+    row = ArchivedDonation.objects.get(pk=archived[0].pk)
+    assert (row.quantity, row.institution_id, row.user_id, row.pick_up_date) == (3, institutions[0].pk, user.pk, old)
+    assert row.category_ids == [categories[0].pk, categories[1].pk]
+    assert row.category_names == 'category0, category1'
+
+    # archived donations keep counting in the stats
+    assert list(rollup_rows.all()) == rollups
+    assert list(Institution.objects.order_by('pk').values(
+        'total_bags', 'donation_count', 'last_donation_date')) == counters
+    call_command('rebuild_donation_rollups', stdout=io.StringIO())
+    assert list(rollup_rows.all()) == rollups
+    out = io.StringIO()
+    call_command('reconcile_institution_counters', '--dry-run', stdout=out)
+    assert '0 institutions would be fixed.' in out.getvalue()
+
+    recent.delete()
+    institutions[1].refresh_from_db()
+    assert institutions[1].last_donation_date == old - timedelta(days=1)
+
+
+@pytest.mark.django_db
+def test_archive_batch_sends_delete_signals_but_keeps_aggregates(user, institutions, categories):
+    old = date.today() - timedelta(days=400)
+    donations = [make_donation(user, institutions[0], categories[:2], old) for _ in range(3)]
+    rollups = set(DonationRollup.objects.values_list('day', 'institution', 'category', 'city', 'bags', 'donations'))
+    counters = Institution.objects.values_list('total_bags', 'donation_count', 'last_donation_date').get(
+        pk=institutions[0].pk)
+    deleted = []
+
+    def record_delete(sender, instance, **kwargs):
+        deleted.append(instance.pk)
+
+    post_delete.connect(record_delete, sender=Donation)
+    try:
+        assert archive.archive_batch(date.today(), 10) == 3
+    finally:
+        post_delete.disconnect(record_delete, sender=Donation)
+
+    # other delete handlers still run, only the rollups and counters skip archived donations
+    assert sorted(deleted) == sorted(donation.pk for donation in donations)
+    assert not archive.archiving.get()
+    assert set(DonationRollup.objects.values_list(
+        'day', 'institution', 'category', 'city', 'bags', 'donations')) == rollups
+    assert Institution.objects.values_list('total_bags', 'donation_count', 'last_donation_date').get(
+        pk=institutions[0].pk) == counters == (9, 3, old)
+
+
+@pytest.mark.django_db
+def test_profile_history_pages_into_archive(user, institutions, categories, monkeypatch):
+    monkeypatch.setattr(ProfileView, 'paginate_by', 3)
+    old = date.today() - timedelta(days=400)
+    live = [make_donation(user, institutions[0], categories[:1], date.today() - timedelta(days=i)) for i in range(4)]
+    for i in range(4):
+        make_donation(user, institutions[1], categories[:2], old - timedelta(days=i))
+    call_command('archive_donations', '--sleep', '0', stdout=io.StringIO())
+    client = Client()
+    client.force_login(user)
+
+    page = client.get(reverse('Profile')).context['donations']
+    assert [donation.pk for donation in page] == [donation.pk for donation in live[:3]]
+    assert page.paginator.num_pages == 3
+
+    response = client.get(reverse('Profile'), {'page': 2})
+    items = list(response.context['donations'])
+    assert items[0].pk == live[3].pk and not items[0].is_archived
+    assert all(item.is_archived for item in items[1:])
+    assert response.context['editable']
+
+    response = client.get(reverse('Profile'), {'page': 3})
+    assert all(item.is_archived for item in response.context['donations'])
+    assert not response.context['editable']
+    assertContains(response, 'category0, category1')
+    assert 'name="is_taken_' not in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_profile_post_only_updates_submitted_donations(user, donations):
+    client = Client()
+    client.force_login(user)
+    Donation.objects.update(is_taken=True)
+    submitted = donations[:3]
+
+    client.post(reverse('Profile'), {'donations': [donation.pk for donation in submitted],
+                                     f'is_taken_{submitted[0].pk}': 'true'})
+    taken = set(Donation.objects.filter(is_taken=True).values_list('pk', flat=True))
+    assert taken == {donation.pk for donation in donations} - {submitted[1].pk, submitted[2].pk}
+
+
+@pytest.mark.django_db
+def test_profile_post_writes_status_changes_with_one_insert(user, donations, django_capture_on_commit_callbacks):
+    client = Client()
+    client.force_login(user)
+    flipped = donations[:3]
+    # the hooks run when the capture exits, so it is the inner context
+    with CaptureQueriesContext(connection) as queries, django_capture_on_commit_callbacks(execute=True) as callbacks:
+        client.post(reverse('Profile'), {f'is_taken_{donation.pk}': 'true' for donation in flipped})
+
+    assert len([hook for hook in callbacks if isinstance(getattr(hook, '__self__', None), audit.StatusChangeBatch)]) == 1
+    inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "charity_donations_donationstatuschange"')]
+    assert len(inserts) == 1
+    changes = DonationStatusChange.objects.order_by('donation_id')
+    assert [(change.donation_id, change.is_taken, change.changed_by_id) for change in changes] == [
+        (donation.pk, True, user.pk) for donation in flipped]
+    assert list(donations[0].status_changes.all()) == [changes[0]]
+
+
+@pytest.mark.django_db
+def test_status_changes_of_rolled_back_transaction_are_dropped(user, donations, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(RuntimeError), transaction.atomic():
+            audit.record_status_change(donations[0], user)
+            raise RuntimeError
+        audit.record_status_change(donations[1], user)
+    assert list(DonationStatusChange.objects.values_list('donation_id', flat=True)) == [donations[1].pk]
+
+
+@pytest.mark.django_db
+def test_prune_donation_status_changes_command(user, donations, superusers):
+    now = timezone.now()
+
+    def change(donation, days, is_taken=True):
+        return DonationStatusChange.objects.create(donation=donation, changed_by=user, is_taken=is_taken,
+                                                   changed_at=now - timedelta(days=days))
+
+    expired = change(donations[0], 800)
+    old_first, old_last = change(donations[0], 100.5, False), change(donations[0], 100.4, True)
+    recent_first, recent_last = change(donations[0], 1.5, False), change(donations[0], 1.4, True)
+    other = change(donations[1], 100.45)
+
+    out = io.StringIO()
+    call_command('prune_donation_status_changes', '--dry-run', stdout=out)
+    assert '1 expired entries would be deleted.' in out.getvalue()
+    assert '1 superseded entries would be compacted.' in out.getvalue()
+    call_command('prune_donation_status_changes', '--sleep', '0', stdout=io.StringIO())
+    assert set(DonationStatusChange.objects.values_list('pk', flat=True)) == {
+        old_last.pk, recent_first.pk, recent_last.pk, other.pk}
+    assert not DonationStatusChange.objects.filter(pk__in=[expired.pk, old_first.pk]).exists()
+
+    client = Client()
+    client.force_login(superusers[0])
+    url = reverse('admin:charity_donations_donationstatuschange_changelist')
+    assertContains(client.get(url, {'q': str(donations[1].pk)}), 'field-donation_id', count=1)
+    assert client.get(url, {'q': user.username}).status_code == 200
+
+
+def auth_user_selects(queries):
+    return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "auth_user"' in query['sql']]
+
+
+@pytest.mark.django_db
+def test_session_user_is_served_from_cache_until_it_changes(user):
+    client = Client()
+    client.force_login(user)
+    with CaptureQueriesContext(connection) as first:
+        client.get(reverse('Settings'))
+    with CaptureQueriesContext(connection) as second:
+        response = client.get(reverse('Settings'))
+
+    assert len(auth_user_selects(first)) == 1
+    assert auth_user_selects(second) == []
+    assert len(second) == len(first) - 1
+    assert response.wsgi_request.user == user
+    assertContains(response, 'test@gmail.com')
+    # the password hash stays out of the cache, it is loaded when something needs it
+    snapshot = cache.get(user_cache.SNAPSHOT_KEY.format(client.session.session_key))
+    assert user.password not in snapshot['values']
+    assert response.wsgi_request.user.get_deferred_fields() == {'password'}
+    assert response.wsgi_request.user.check_password('Random?1')
+
+    # another session of the same user changes the e-mail
+    other = Client()
+    other.force_login(user)
+    other.post(reverse('Settings'), {'form_type': 'update_info', 'username': 'test', 'email': 'new@example.com',
+                                     'first_name': 'test', 'last_name': 'test', 'password': 'Random?1'})
+    assertContains(client.get(reverse('Settings')), 'new@example.com')
+
+
+@pytest.mark.django_db
+def test_cached_session_is_dropped_after_password_change_elsewhere(user):
+    client = Client()
+    client.force_login(user)
+    assert client.get(reverse('Profile')).status_code == 200
+
+    user.set_password('Changed?2')
+    user.save()
+    response = client.get(reverse('Profile'))
+    assert response.status_code == 302
+    assert not response.wsgi_request.user.is_authenticated
+
+
+@pytest.mark.django_db
+def test_last_login_is_written_at_most_once_per_interval(user, settings):
+    settings.LAST_LOGIN_UPDATE_INTERVAL = 3600
+    credentials = {'username': 'test', 'password': 'Random?1'}
+    Client().post(reverse('Login'), credentials)
+    user.refresh_from_db()
+    first_login = user.last_login
+    assert first_login is not None
+
+    with CaptureQueriesContext(connection) as queries:
+        Client().post(reverse('Login'), credentials)
+    user.refresh_from_db()
+    assert user.last_login == first_login
+    assert not [query for query in queries if query['sql'].startswith('UPDATE "auth_user"')]
+
+    settings.LAST_LOGIN_UPDATE_INTERVAL = 0
+    Client().post(reverse('Login'), credentials)
+    user.refresh_from_db()
+    assert user.last_login > first_login
+
+
+@pytest.mark.django_db
+def test_login_rehashes_password_with_configured_iterations(user, settings):
+    assert user.password.startswith('pbkdf2_sha256$')
+    settings.PASSWORD_HASH_ITERATIONS = 1000
+    response = Client().post(reverse('Login'), {'username': 'test', 'password': 'Random?1'})
+    assert response.status_code == 302
+
+    user.refresh_from_db()
+    assert user.password.startswith('pbkdf2_sha256$1000$')
+    assert user.check_password('Random?1')
+
+
+def test_calibrate_hasher_command():
+    out = io.StringIO()
+    call_command('calibrate_hasher', '--probe-iterations', '1000', '--rounds', '1', '--target-ms', '0.001',
+                 stdout=out)
+    assert 'ns per iteration' in out.getvalue()
+    assert 'using the minimum of 600000 instead' in out.getvalue()
+    assert 'PASSWORD_HASH_ITERATIONS=600000' in out.getvalue()
+    with pytest.raises(CommandError):
+        call_command('calibrate_hasher', '--rounds', '0')
+
+
+@pytest.mark.django_db
+def test_pages_send_preload_links_and_early_hints(user):
+    client = Client()
+    response = client.get(reverse('LandingPage'))
+    assert response['Link'] == ('</static/css/style.css>; rel=preload; as=style, '
+                                '</static/js/app.js>; rel=preload; as=script, '
+                                '</static/images/header-bg.jpg>; rel=preload; as=image')
+    client.force_login(user)
+    assert 'header-form-bg.jpg' in client.get(reverse('AddDonation'))['Link']
+    assert 'images' not in client.get(reverse('Profile'))['Link']
+    assert not client.get(reverse('DonationOrganizations')).has_header('Link')
+
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': reverse('LandingPage'), 'root_path': '',
+             'extensions': {'http.response.early_hint': {}}}
+    async_to_sync(EarlyHintsMiddleware(app))(scope, None, send)
+    assert sent[0] == {'type': 'http.response.early_hint', 'links': [
+        link.encode() for link in response['Link'].split(', ')]}
+    assert sent[1]['type'] == 'http.response.start'
+
+    # without the server extension, or for a view that serves no pages, only the response goes out
+    sent.clear()
+    async_to_sync(EarlyHintsMiddleware(app))({**scope, 'extensions': {}}, None, send)
+    async_to_sync(EarlyHintsMiddleware(app))({**scope, 'path': reverse('DonationOrganizations')}, None, send)
+    assert [message['type'] for message in sent] == ['http.response.start', 'http.response.start']
+
+
+@pytest.mark.django_db
+def test_build_critical_css_inlines_the_header_rules(settings, tmp_path):
+    settings.CRITICAL_CSS_DIR = str(tmp_path)
+    client = Client()
+    assertContains(client.get(reverse('LandingPage')), '<link type="text/css" href="/static/css/style.css" rel="stylesheet"/>')
+
+    out = io.StringIO()
+    try:
+        call_command('build_critical_css', 'index.html', stdout=out)
+        assert 'index.html: ' in out.getvalue()
+        page = client.get(reverse('LandingPage')).content.decode()
+        style = re.search(r'<style>(.*?)</style>', page, re.S).group(1)
+        assert 'header.header--main-page{background-image: url("/static/images/header-bg.jpg");' in style
+        # rules of the steps below the fold stay in the full stylesheet
+        assert '.form--steps-container' not in style
+        assert 'rel="preload" as="style" onload="this.onload=null;this.rel=\'stylesheet\'"' in page
+        assert '<noscript><link type="text/css" href="/static/css/style.css" rel="stylesheet"/></noscript>' in page
+    finally:
+        critical_css.cached_load.cache_clear()
+
+    with pytest.raises(CommandError):
+        call_command('build_critical_css', 'profile.html')
+
+
+@pytest.mark.django_db
+def test_service_worker_is_served_from_the_root(user):
+    client = Client()
+    response = client.get('/sw.js')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'text/javascript'
+    assert response['Service-Worker-Allowed'] == '/'
+    assert 'no-cache' in response['Cache-Control']
+    script = response.content.decode()
+    for url in ('/static/css/style.css', '/static/js/app.js', '/static/images/header-form-bg.jpg',
+                '/static/images/decoration.svg', '/static/images/icon-facebook.svg', '"/donation/"'):
+        assert url in script
+    # README screenshots are not used by the pages
+    assert 'pytests.png' not in script
+    assert client.get('/sw.js', HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+
+    # the cached form shell gets its CSRF token on use
+    client.force_login(user)
+    page = client.get(reverse('AddDonation'))
+    assertContains(page, f'data-csrf-url="{reverse("CsrfToken")}"')
+    assertContains(page, 'data-service-worker="/sw.js"')
+    assertContains(page, 'data-csrf-url', count=3)
+    assert 'csrfmiddlewaretoken' not in page.content.decode()
+
+
+@pytest.mark.django_db
+def test_landing_page_list_flip_renders_only_the_list(institutions):
+    client = Client()
+    url = reverse('LandingPage')
+    client.get(url)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, {'list': 'foundations', 'page_foundations': 4})
+    # the catalog snapshot is loaded already and the statistics are skipped
+    assert len(queries) == 0
+    assertTemplateUsed(response, 'help_list.html')
+    assertTemplateNotUsed(response, 'index.html')
+    assertContains(response, 'data-list="foundations"')
+    assertContains(response, 'data-number="4"')
+    assertContains(response, 'Institution 9')
+    assertNotContains(response, 'Institution 8')
+
+    # an unknown list gets the whole page
+    assertTemplateUsed(client.get(url, {'list': 'unknown'}), 'index.html')
@@ -1,21 +1,49 @@
 from django.urls import path
-from django.contrib.auth import views as auth_views
+from django.utils.module_loading import import_string
+
 from charity_donations import views
 
+
+def lazy_view(dotted_path, **initkwargs):
+    """
+    Import a class-based view on the first request to its URL. Rarely used pages (and what they
+    import) then don't add to the start-up time of every worker.
+    """
+    view = None
+
+    def lazy(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return lazy
+
+
 urlpatterns = [
     path('', views.LandingPageView.as_view(), name='LandingPage'),
     path('donation/', views.AddDonationView.as_view(), name='AddDonation'),
     path('login/', views.LoginView.as_view(), name='Login'),
-    path('register/', views.RegisterView.as_view(), name='Register'),
+    path('register/', lazy_view('charity_donations.account_views.RegisterView'), name='Register'),
     path('logout/', views.LogoutView.as_view(), name='Logout'),
+    path('donation/organizations/', views.DonationOrganizationsView.as_view(), name='DonationOrganizations'),
     path('donation/form-confirmation/', views.FormConfirmationView.as_view(), name='FormConfirmation'),
     path('profile/', views.ProfileView.as_view(), name='Profile'),
     path('settings/', views.SettingsView.as_view(), name='Settings'),
-    path('activate/<uidb64>/<token>/', views.ActivateAccountView.as_view(), name='ActivateAccount'),
-    path('password_reset/', auth_views.PasswordResetView.as_view(), name='password_reset'),
-    path('password_reset/done/', auth_views.PasswordResetDoneView.as_view(), name='password_reset_done'),
-    path('reset/<uidb64>/<token>/', views.CustomPasswordResetConfirmView.as_view(), name='password_reset_confirm'),
-    path('reset/done/', auth_views.PasswordResetCompleteView.as_view(), name='password_reset_complete'),
-    path('contact/', views.ContactView.as_view(), name='Contact'),
-    path('contact/success/', views.SuccessMessageView.as_view(), name='SuccessMessage'),
+    path('activate/<uidb64>/<token>/', lazy_view('charity_donations.account_views.ActivateAccountView'),
+         name='ActivateAccount'),
+    path('password_reset/', lazy_view('django.contrib.auth.views.PasswordResetView'), name='password_reset'),
+    path('password_reset/done/', lazy_view('django.contrib.auth.views.PasswordResetDoneView'),
+         name='password_reset_done'),
+    path('reset/<uidb64>/<token>/', lazy_view('charity_donations.account_views.CustomPasswordResetConfirmView'),
+         name='password_reset_confirm'),
+    path('reset/done/', lazy_view('django.contrib.auth.views.PasswordResetCompleteView'),
+         name='password_reset_complete'),
+    path('contact/', lazy_view('charity_donations.contact_views.ContactView'), name='Contact'),
+    path('contact/success/', lazy_view('charity_donations.contact_views.SuccessMessageView'), name='SuccessMessage'),
+    path('csrf/', views.CsrfTokenView.as_view(), name='CsrfToken'),
+    path('sw.js', views.ServiceWorkerView.as_view(), name='ServiceWorker'),
+    path('stats/', lazy_view('charity_donations.staff_views.DonationStatsView'), name='DonationStats'),
+    path('profiling/<str:report>', lazy_view('charity_donations.staff_views.ProfilingReportView'),
+         name='ProfilingReport'),
 ]
@@ -0,0 +1,83 @@
+"""
+Per-session cache of the logged-in user.
+
+get_user() keeps a snapshot of the user's fields in the cache under the session key, stamped
+with the user's cache version. Saving or deleting a User drops the version (see signals), which
+makes the snapshots of all their sessions stale at once. Logging in again and changing the
+password cycle the session key, so those sessions start with a fresh snapshot anyway.
+
+The password hash is not cached: the snapshot keeps the session auth hash derived from it, and
+the user is rebuilt with the password deferred, loaded on first use like any deferred field.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+SNAPSHOT_KEY = 'session-user:{}'
+VERSION_KEY = 'user-version:{}'
+FIELDS = tuple(field.attname for field in User._meta.concrete_fields if field.attname != 'password')
+
+
+def invalidate_user(user_id):
+    # drop the version now and once more after commit, so a reader racing the transaction cannot keep it
+    cache.delete(VERSION_KEY.format(user_id))
+    transaction.on_commit(lambda: cache.delete(VERSION_KEY.format(user_id)))
+
+
+def user_version(user_id):
+    """The cache version of a user, a new one is started when there is none."""
+    version_key = VERSION_KEY.format(user_id)
+    # add() keeps a version another request has just started
+    cache.add(version_key, uuid.uuid4().hex, settings.USER_CACHE_TIMEOUT)
+    return cache.get(version_key)
+
+
+def get_user(request):
+    """Like django.contrib.auth.get_user(), but served from the cache while the user is unchanged."""
+    session = request.session
+    user_id, backend = session.get(auth.SESSION_KEY), session.get(auth.BACKEND_SESSION_KEY)
+    if user_id is None or session.session_key is None or backend not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    snapshot_key, version_key = SNAPSHOT_KEY.format(session.session_key), VERSION_KEY.format(user_id)
+    cached = cache.get_many([snapshot_key, version_key])
+    version, snapshot = cached.get(version_key), cached.get(snapshot_key)
+    if version is not None and snapshot is not None and snapshot['version'] == version \
+            and snapshot['backend'] == backend and snapshot['user_id'] == str(user_id):
+        session_hash = session.get(auth.HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(session_hash, snapshot['session_hash']):
+            return User.from_db(router.db_for_read(User), FIELDS, snapshot['values'])
+    # a miss, or a session that only a fallback secret verifies: auth does the full check
+
+    # the version is read before the user is loaded, so a save in between leaves the snapshot stale
+    version = version or user_version(user_id)
+    user = auth.get_user(request)
+    if user.is_authenticated and version is not None and session.session_key is not None:
+        cache.set(SNAPSHOT_KEY.format(session.session_key), {
+            'version': version,
+            'backend': backend,
+            'user_id': str(user.pk),
+            'values': tuple(getattr(user, name) for name in FIELDS),
+            'session_hash': user.get_session_auth_hash(),
+        }, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def update_last_login(sender, user, **kwargs):
+    """
+    Replaces django.contrib.auth.models.update_last_login, writing last_login at most once per
+    LAST_LOGIN_UPDATE_INTERVAL seconds. The first login is always recorded.
+    """
+    now = timezone.now()
+    if user.last_login and now - user.last_login < timedelta(seconds=settings.LAST_LOGIN_UPDATE_INTERVAL):
+        return
+    user.last_login = now
+    # update() sends no post_save: a new login date does not need to drop the user's cached sessions
+    User.objects.filter(pk=user.pk).update(last_login=now)
@@ -0,0 +1,98 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from charity_donations.models import DataVersion
+
+CACHE_KEY = 'data-version:{}'
+
+
+class VersionBump:
+    """The on_commit hook incrementing one data version, registered once per transaction and key."""
+
+    def __init__(self, key, using):
+        self.key = key
+        self.using = using
+        self.pending = True
+
+    def __call__(self):
+        self.pending = False
+        versions = DataVersion.objects.using(self.using)
+        updated = versions.filter(key=self.key).update(version=F('version') + 1, updated_at=timezone.now())
+        if not updated:
+            versions.get_or_create(key=self.key, defaults={'version': 1})
+        cache.delete(CACHE_KEY.format(self.key))
+
+
+def bump_version(key, using=DEFAULT_DB_ALIAS):
+    """
+    Increment a data version once the current transaction commits, at once outside a transaction.
+
+    The DataVersion row is shared by every writer of its data, so it is only locked for the short
+    UPDATE after the commit instead of until the end of each writer's transaction.
+    """
+    connection = transaction.get_connection(using)
+    if any(isinstance(hook, VersionBump) and hook.key == key and hook.pending
+           for _, hook, _ in connection.run_on_commit):
+        return
+    # robust: the data is committed already, a failed bump must not become an error page
+    transaction.on_commit(VersionBump(key, using), using=using, robust=True)
+
+
+def get_versions(keys):
+    """Return {key: (version, updated_at)}, served from the cache when possible."""
+    cache_keys = {CACHE_KEY.format(key): key for key in keys}
+    cached = cache.get_many(cache_keys)
+    versions = {cache_keys[cache_key]: value for cache_key, value in cached.items()}
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            versions[key] = (0, None)
+        for row in DataVersion.objects.filter(key__in=missing):
+            versions[row.key] = (row.version, row.updated_at)
+        cache.set_many({CACHE_KEY.format(key): versions[key] for key in missing},
+                       settings.DATA_VERSION_CACHE_TIMEOUT)
+    return versions
+
+
+def _request_versions(request, keys):
+    # etag_func and last_modified_func run for the same request, fetch the versions once
+    memo = request.__dict__.setdefault('_data_versions', {})
+    if keys not in memo:
+        memo[keys] = get_versions(keys)
+    return memo[keys]
+
+
+def data_version_etag(*keys):
+    """
+    Build an etag_func for django.views.decorators.http.condition from data versions.
+
+    The tag is weak because the body still differs in the masked CSRF token, and it
+    includes the logged-in user since the navbar greets them by name.
+    """
+
+    def etag_func(request, *args, **kwargs):
+        versions = _request_versions(request, keys)
+        parts = [f'{key}{versions[key][0]}' for key in keys]
+        if request.user.is_authenticated:
+            user_part = f'{request.user.pk}:{request.user.username}:{request.user.is_superuser}'
+            parts.append(hashlib.md5(user_part.encode(), usedforsecurity=False).hexdigest()[:12])
+        return 'W/"{}"'.format('-'.join(parts))
+
+    return etag_func
+
+
+def data_version_last_modified(*keys):
+    """Build a last_modified_func returning the newest change of the given data versions."""
+
+    def last_modified_func(request, *args, **kwargs):
+        versions = _request_versions(request, keys)
+        dates = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+        return max(dates) if dates else None
+
+    return last_modified_func
@@ -1,76 +1,98 @@
-import json
-
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
-from django.contrib.auth.tokens import default_token_generator
-from django.contrib.auth.views import PasswordResetConfirmView
-from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
 from django.core.paginator import Paginator
-from django.db import models
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+from django.db import models, transaction
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
-from django.template.loader import render_to_string
 from django.urls import reverse
-from django.utils.encoding import force_bytes, force_str
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
 from django.views import View
-
-from charity_donations.forms import CustomSetPasswordForm, RegistrationForm, PasswordChangeForm, UserUpdateForm, \
-    ContactForm
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import condition
+
+from charity_donations import audit
+from charity_donations.archive import DonationHistory
+from charity_donations.budgets import query_budget
+from charity_donations.catalog import get_catalog
+from charity_donations.forms import PasswordChangeForm, UserUpdateForm
 # from charity_donations.forms import ChangePasswordForm
-from charity_donations.models import Donation, Institution, Category
-from config import settings
+from charity_donations.mixins import SharedCacheMixin
+from charity_donations.routers import read_from_replica
+from charity_donations.service_worker import service_worker
+from charity_donations.models import Donation, Institution, DataVersion
+from charity_donations.versioning import data_version_etag, data_version_last_modified
 
 
 # Create your views here.
 
-class LandingPageView(View):
-
+# the institution lists of the landing page's Help section: (name in the template and the query string, type)
+HELP_LISTS = (
+    ('foundations', Institution.FOUNDATION),
+    ('ngos', Institution.NGO),
+    ('local_collections', Institution.LOCAL_COLLECTION),
+)
+
+
+# the landing page (and its AJAX pagination) only changes with the catalog or donations,
+# so returning visitors get a 304 without running the aggregates or rendering
+@method_decorator(condition(
+    etag_func=data_version_etag(DataVersion.CATALOG, DataVersion.DONATIONS),
+    last_modified_func=data_version_last_modified(DataVersion.CATALOG, DataVersion.DONATIONS),
+), name='get')
+class LandingPageView(SharedCacheMixin, View):
+
+    @read_from_replica
+    # 2 aggregates + session and user, the catalog adds 4 only when its version changed
+    @query_budget(max_queries=8, max_duration_ms=500)
     def get(self, request):
-        number_of_bags = Donation.objects.aggregate(total_bags=models.Sum('quantity'))['total_bags'] or 0
-        number_of_institutions = Donation.objects.values('institution').distinct().count()
-
-        foundations = Institution.objects.filter(type=Institution.FOUNDATION)
-        paginator_foundations = Paginator(foundations, 3)
-        page_number_foundations = request.GET.get('page_foundations')
-        page_object_foundations = paginator_foundations.get_page(page_number_foundations)
+        # the lists page through the catalog snapshot: no COUNT or OFFSET queries
+        catalog = get_catalog()
+        lists = {
+            list_name: Paginator(catalog.institutions_by_type[institution_type], 3).get_page(
+                request.GET.get(f'page_{list_name}'))
+            for list_name, institution_type in HELP_LISTS
+        }
 
-        local_collections = Institution.objects.filter(type=Institution.LOCAL_COLLECTION)
-        paginator_local_collections = Paginator(local_collections, 3)
-        page_number_local_collections = request.GET.get('page_local_collections')
-        page_object_local_collections = paginator_local_collections.get_page(page_number_local_collections)
+        list_name = request.GET.get('list')
+        if list_name in lists:
+            # a page flip of one list in app.js, without the statistics of the whole page
+            return render(request, 'help_list.html', {'page': lists[list_name], 'list_name': list_name})
 
-        ngos = Institution.objects.filter(type=Institution.NGO)
-        paginator_ngos = Paginator(ngos, 3)
-        page_number_ngos = request.GET.get('page_ngos')
-        page_object_ngos = paginator_ngos.get_page(page_number_ngos)
+        # from the denormalized counters, the donation table is not touched
+        stats = Institution.objects.aggregate(
+            total_bags=models.Sum('total_bags'),
+            supported=models.Count('pk', filter=models.Q(donation_count__gt=0)),
+        )
+        number_of_bags = stats['total_bags'] or 0
+        number_of_institutions = stats['supported']
+        most_supported = Institution.objects.filter(total_bags__gt=0).order_by('-total_bags', '-donation_count')[:3]
 
         context = {
             'number_of_bags': number_of_bags,
             'number_of_institutions': number_of_institutions,
-            'foundations': page_object_foundations,
-            'local_collections': page_object_local_collections,
-            'ngos': page_object_ngos,
+            'most_supported': most_supported,
+            **lists,
+            # anonymous pages are shared-cacheable, the contact form fetches its token on use
+            'lazy_csrf': not request.user.is_authenticated,
         }
 
         return render(request, 'index.html', context)
 
 
 class AddDonationView(LoginRequiredMixin, View):
+    @read_from_replica
+    @query_budget(max_queries=6, max_duration_ms=500)
     def get(self, request):
-        categories = Category.objects.all()
-        organizations = Institution.objects.all()
-        for organization in organizations:
-            category_ids = list(organization.categories.values_list('id', flat=True))
-            organization.category_ids_json = json.dumps(category_ids)
-
+        # the organizations of step 3 are loaded from DonationOrganizationsView once the categories are known
         context = {
-            'categories': categories,
-            'organizations': organizations,
+            'categories': get_catalog().categories,
+            # the service worker keeps the page as an offline shell, its forms fetch the token on use
+            'lazy_csrf': True,
         }
 
         return render(request, 'form.html', context)
@@ -119,6 +141,40 @@ class AddDonationView(LoginRequiredMixin, View):
             return render(request, 'form.html', {'error_message': str(e)})
 
 
+@method_decorator(condition(
+    etag_func=data_version_etag(DataVersion.CATALOG),
+    last_modified_func=data_version_last_modified(DataVersion.CATALOG),
+), name='get')
+class DonationOrganizationsView(LoginRequiredMixin, View):
+    """Step 3 of the donation form: a page of the institutions accepting all selected categories."""
+    paginate_by = 20
+
+    @read_from_replica
+    @query_budget(max_queries=6, max_duration_ms=500)
+    def get(self, request):
+        try:
+            category_ids = [int(value) for value in request.GET.getlist('categories')]
+        except ValueError:
+            return HttpResponseBadRequest("Invalid category id")
+
+        institutions = get_catalog().institutions_covering(category_ids)
+        page = Paginator(institutions, self.paginate_by).get_page(request.GET.get('page'))
+        return JsonResponse({
+            'count': page.paginator.count,
+            'page': page.number,
+            'num_pages': page.paginator.num_pages,
+            'next_page': page.next_page_number() if page.has_next() else None,
+            'results': [
+                {
+                    'id': institution.id,
+                    'name': institution.name,
+                    'description': institution.description,
+                }
+                for institution in page
+            ],
+        })
+
+
 class FormConfirmationView(LoginRequiredMixin, View):
     def get(self, request):
         return render(request, 'form-confirmation.html')
@@ -179,81 +235,39 @@ class LogoutView(View):
         return redirect('LandingPage')
 
 
-class RegisterView(View):
-    def get(self, request):
-        form = RegistrationForm()
-        return render(request, 'register.html', {'form': form})
-
-    def post(self, request):
-        form = RegistrationForm(request.POST)
-        if form.is_valid():
-            first_name = form.cleaned_data.get('first_name')
-            last_name = form.cleaned_data.get('last_name')
-            username = form.cleaned_data.get('username')
-            email = form.cleaned_data.get('email')
-            password = form.cleaned_data.get('password')
-
-            # Save the user with inactive status
-            u = User(username=username, email=email, first_name=first_name, last_name=last_name, is_active=False)
-            u.set_password(password)
-            u.save()
-
-            # Email account activation part
-            current_site = get_current_site(request)
-            mail_subject = 'Activate your account.'
-            uid = urlsafe_base64_encode(force_bytes(u.pk))
-            token = default_token_generator.make_token(u)
-            message = render_to_string('activation_email.html', {
-                'user': u,
-                'domain': current_site.domain,
-                'uid': uid,
-                'token': token,
-            })
-            send_mail(mail_subject, message, settings.DEFAULT_FROM_EMAIL, [email])
-
-            messages.success(request,
-                             'Prosimy o potwierdzenie konta poprzez link wysłany na podane w rejestracji adres email.')
-            return redirect('Login')
-
-        return render(request, 'register.html', {'form': form})
-
-
-class ActivateAccountView(View):
-    def get(self, request, uidb64, token):
-        try:
-            uid = force_str(urlsafe_base64_decode(uidb64))
-            user = User.objects.get(pk=uid)
-        except (TypeError, ValueError, OverflowError, User.DoesNotExist):
-            user = None
-
-        if user is not None and default_token_generator.check_token(user, token):
-            user.is_active = True
-            user.save()
-            messages.success(request, 'Twoje Konto zostało aktywowane, możesz się teraz zalogować.')
-            return redirect('Login')
-        else:
-            messages.error(request, 'Link aktywacyjny był niepoprawny!')
-            return redirect('Register')
-
-
 class ProfileView(LoginRequiredMixin, View):
+    paginate_by = 20
+
+    @read_from_replica
+    # session, user, 2 counts, the page (donations and their categories, or the archive, or both)
+    @query_budget(max_queries=7, max_duration_ms=500)
     def get(self, request):
-        donations = Donation.objects.filter(user=request.user)
+        # collected donations older than a year are in the archive, past the live ones
+        history = DonationHistory(request.user)
+        page = Paginator(history, self.paginate_by).get_page(request.GET.get('page'))
         context = {
-            'donations': donations,
+            'donations': page,
+            # archived donations are read-only, a page of them only has nothing to save
+            'editable': page.start_index() <= history.recent_count,
         }
 
         return render(request, 'profile.html', context)
 
     def post(self, request):
         donations = Donation.objects.filter(user=request.user)
-        for donation in donations:
-            is_taken_field = f'is_taken_{donation.id}'
-            if is_taken_field in request.POST:
-                donation.is_taken = True
-            else:
-                donation.is_taken = False
-            donation.save()
+        # only the donations of the submitted page, the unchecked boxes of the other pages aren't sent
+        submitted = request.POST.getlist('donations')
+        if submitted:
+            donations = donations.filter(pk__in=[pk for pk in submitted if pk.isdigit()])
+        # one transaction, so the audit log of all changes is written with a single insert on commit
+        with transaction.atomic():
+            for donation in donations:
+                is_taken = f'is_taken_{donation.id}' in request.POST
+                if donation.is_taken == is_taken:
+                    continue
+                donation.is_taken = is_taken
+                donation.save()
+                audit.record_status_change(donation, request.user)
         return redirect('Profile')
 
 
@@ -316,27 +330,18 @@ class SettingsView(LoginRequiredMixin, View):
             return render(request, 'settings.html', context)
 
 
-class CustomPasswordResetConfirmView(PasswordResetConfirmView):
-    form_class = CustomSetPasswordForm
-
-
-class ContactView(View):
-    def post(self, request):
-        form = ContactForm(request.POST)
-        if form.is_valid():
-            name = form.cleaned_data['name']
-            surname = form.cleaned_data['surname']
-            message = form.cleaned_data['message']
-            subject = f"Contact Form Submission from {name} {surname}"
-            email_body = f"Name: {name}\nSurname: {surname}\n\nMessage:\n{message}"
-            superusers = User.objects.filter(is_superuser=True)
-            recipient_list = [user.email for user in superusers if user.email]
-            send_mail(subject, email_body, 'noreply@charity.com', recipient_list)
-            return redirect('SuccessMessage')
-        else:
-            return HttpResponse("Something went terribly wrong and we could not submit the message")
+@method_decorator(never_cache, name='get')
+class CsrfTokenView(View):
+    def get(self, request):
+        return JsonResponse({'token': get_token(request)})
 
 
-class SuccessMessageView(View):
+# browsers check the worker for updates on navigation, unchanged ones get a 304
+@method_decorator(condition(etag_func=lambda request: f'"{service_worker()[0]}"'), name='get')
+class ServiceWorkerView(View):
     def get(self, request):
-        return render(request, 'success_message.html')
+        response = HttpResponse(service_worker()[1], content_type='text/javascript')
+        # served from /sw.js its default scope is the whole site already, the header keeps it so if it moves
+        response['Service-Worker-Allowed'] = '/'
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# imported once get_asgi_application() has loaded the apps
+from charity_donations.middleware import EarlyHintsMiddleware  # noqa: E402
+
+application = EarlyHintsMiddleware(application)
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    pbkdf2_sha256 with the iteration count taken from PASSWORD_HASH_ITERATIONS (see the
+    calibrate_hasher command). It keeps Django's algorithm name, so existing hashes stay valid and
+    check_password() rehashes them on the next login when their iteration count differs.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS or PBKDF2PasswordHasher.iterations
@@ -0,0 +1,75 @@
+/**
+ * Service worker: precached static files and the donation form shell (charity_donations.service_worker)
+ */
+const CONFIG = {{ config|safe }};
+const STATIC_CACHE = `charity-static-${CONFIG.version}`;
+const PAGES_CACHE = `charity-pages-${CONFIG.version}`;
+
+self.addEventListener("install", event => {
+    event.waitUntil(
+        caches.open(STATIC_CACHE)
+            .then(cache => cache.addAll(CONFIG.precache))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener("activate", event => {
+    // Caches of earlier deploys
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names
+                .filter(name => name.startsWith("charity-") && name !== STATIC_CACHE && name !== PAGES_CACHE)
+                .map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener("fetch", event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (request.method !== "GET") {
+        if (request.mode === "navigate" && CONFIG.sessionChanges.includes(url.pathname)) {
+            // The cached shells greet the previous user
+            event.waitUntil(caches.delete(PAGES_CACHE));
+        }
+        return;
+    }
+
+    if (url.pathname.startsWith(CONFIG.staticUrl)) {
+        event.respondWith(cacheFirst(request));
+    } else if (request.mode === "navigate" && url.search === "" && CONFIG.shells.includes(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event, request));
+    }
+    // Everything else, the organizations of the form included, goes to the network as usual
+});
+
+function cacheFirst(request) {
+    // Hashed file names never change their content
+    return caches.match(request).then(cached => cached || fetch(request).then(response => {
+        if (response.ok) {
+            const copy = response.clone();
+            caches.open(STATIC_CACHE).then(cache => cache.put(request, copy));
+        }
+        return response;
+    }));
+}
+
+function staleWhileRevalidate(event, request) {
+    const network = fetch(request);
+    // Refresh the shell in the background, a redirect to the login page is not the shell
+    event.waitUntil(network
+        .then(response => {
+            if (response.ok && !response.redirected) {
+                const copy = response.clone();
+                return caches.open(PAGES_CACHE).then(cache => cache.put(request, copy));
+            }
+        })
+        .catch(() => null));
+    return caches.open(PAGES_CACHE)
+        .then(cache => cache.match(request, {ignoreVary: true}))
+        .then(cached => cached || network);
+}